@@ -1,7 +1,17 @@
+import aiohttp
 import discord
 from discord.ext import commands
 from utils.logging_utils import setup_logger
 from utils.logging_utils import unexpected_error_handler
+from utils.database_utils import close_client
+from google_auth_creds import stop_credentials_refresh
+from utils.youtube_utils import notification_pipeline
+from config import BOT_QUEUE
+from queries.youtube_queries import create_video_indexes
+from utils.channel_cache import channel_cache
+from utils.lichess_api import lichess_api
+from utils.http_utils import close_session, open_session
+from utils.channel_registry import ChannelRegistry
 
 extensions = ["cogs.UtilsCogs", "cogs.YoutubeCogs", "cogs.ChessCogs", "cogs.FrenchCogs"]
 
@@ -12,14 +22,46 @@ class Bioz(commands.Bot):
         intents.message_content = True
         super().__init__(command_prefix='?', intents=intents)
         self.logger = setup_logger(__name__)
+        self.session: aiohttp.ClientSession = None
+        self.channel_registry = ChannelRegistry(self)
 
     async def on_ready(self):
-        self.logger.info(f"Logged in as {self.user}")
-        channel = discord.utils.get(
-            self.get_all_channels(), guild__name='Bot', name='debug')
+        self.channel_registry.build()
+        self.logger.info(f"Logged in as {self.user}, indexed {len(self.channel_registry)} channels")
+        channel = self.channel_registry.get('Bot', 'debug')
         await channel.send("I'm ready!", delete_after=5)
 
+    # Keep the channel registry current
+    async def on_guild_join(self, guild: discord.Guild):
+        self.channel_registry.index_guild(guild)
+
+    async def on_guild_available(self, guild: discord.Guild):
+        self.channel_registry.index_guild(guild)
+
+    async def on_guild_update(self, before: discord.Guild, after: discord.Guild):
+        self.channel_registry.index_guild(after)
+
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.channel_registry.forget_guild(guild.id)
+
+    async def on_guild_unavailable(self, guild: discord.Guild):
+        self.channel_registry.forget_guild(guild.id)
+
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel):
+        self.channel_registry.index_guild(channel.guild)
+
+    async def on_guild_channel_update(self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+        self.channel_registry.index_guild(after.guild)
+
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        self.channel_registry.index_guild(channel.guild)
+
     async def setup_hook(self) -> None:
+        self.session = await open_session()
+        await lichess_api.start()
+        notification_pipeline.start()
+        await create_video_indexes.aio()
+        await channel_cache.start()
         try:
             for extension in extensions:
                 await self.load_extension(extension)
@@ -28,6 +70,17 @@ class Bioz(commands.Bot):
         except Exception as e:
             unexpected_error_handler(self.logger, e, extension=extension)
 
+    async def close(self) -> None:
+        await super().close()
+        await notification_pipeline.stop()
+        channel_cache.stop()
+        await lichess_api.close()
+        await close_session()
+        close_client()
+        stop_credentials_refresh()
+        BOT_QUEUE.close()
+        self.logger.info("Closed HTTP session and MongoDB client")
+
     async def on_error(self, event_method: str, /, *args, **kwargs):
         # return await super().on_error(event_method, *args, **kwargs)
         unexpected_error_handler(
@@ -0,0 +1,42 @@
+"""
+Compare the lxml streaming feed parser with the former BeautifulSoup parser
+on recorded hub payloads.
+
+Run from the repository root:
+    python -m benchmarks.feed_parser [iterations]
+"""
+import pathlib
+import sys
+import timeit
+from bs4 import BeautifulSoup
+
+from webhook.parsers import parse_feed
+
+PAYLOADS = pathlib.Path(__file__).parent / "payloads"
+
+
+def bs4_parse(content: bytes) -> list[dict[str, str]]:
+    # Former youtube_parser: only the first entry is read
+    soup = BeautifulSoup(content, 'xml')
+    if not soup.entry:
+        return []
+    entry = soup.entry
+    return [{
+        "_id": entry.videoId.text,
+        "channelId": entry.channelId.text,
+        "title": entry.title.text,
+    }]
+
+
+def lxml_parse(content: bytes) -> list:
+    return list(parse_feed(content))
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    for path in sorted(PAYLOADS.glob("*.xml")):
+        content = path.read_bytes()
+        print(f"{path.name}: bs4 found {len(bs4_parse(content))} records, lxml found {len(lxml_parse(content))}")
+        for name, func in [("bs4", bs4_parse), ("lxml", lxml_parse)]:
+            total = timeit.timeit(lambda: func(content), number=iterations)
+            print(f"  {name:>5}: {total / iterations * 1e6:8.1f} us/payload")
@@ -0,0 +1,64 @@
+"""
+Per-call overhead of the transport behind utils.youtube_api.
+A local server answers videos.list with a canned response, and a request made
+on a fresh ClientSession per call (the connection setup every call paid when a
+client was built per request) is timed against the shared keep-alive session
+YouTubeApi uses. No network access or credentials are needed; over loopback
+there is no DNS or TLS, so the gap against googleapis.com is larger.
+
+Run from the repository root:
+    python -m benchmarks.youtube_client [iterations]
+"""
+import asyncio
+import sys
+import time
+import aiohttp
+from aiohttp import web
+
+from utils.http_utils import close_session, open_session
+
+RESPONSE = {"kind": "youtube#videoListResponse", "items": []}
+PARAMS = {"part": "contentDetails,snippet", "id": "VIDEO_ID"}
+
+
+async def videos(request: web.Request):
+    return web.json_response(RESPONSE)
+
+
+async def session_per_call(url: str, session: aiohttp.ClientSession):
+    # Previous behaviour: a new connection pool for every request
+    async with aiohttp.ClientSession() as fresh_session:
+        async with fresh_session.get(url, params=PARAMS) as resp:
+            await resp.json()
+
+
+async def shared_session(url: str, session: aiohttp.ClientSession):
+    async with session.get(url, params=PARAMS) as resp:
+        await resp.json()
+
+
+async def main(iterations: int):
+    app = web.Application()
+    app.router.add_get("/youtube/v3/videos", videos)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    url = f"http://127.0.0.1:{runner.addresses[0][1]}/youtube/v3/videos"
+
+    session = await open_session()
+    try:
+        await shared_session(url, session)  # Exclude the first connection from the measurement
+        for name, func in [("session per call", session_per_call), ("shared session", shared_session)]:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                await func(url, session)
+            total = time.perf_counter() - start
+            print(f"{name:>16}: {total / iterations * 1000:8.3f} ms/call ({iterations} calls)")
+    finally:
+        await close_session()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
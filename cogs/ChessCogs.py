@@ -1,9 +1,14 @@
-import re
-import aiohttp
+import asyncio
+import contextlib
 import discord
 from discord.ext import commands, tasks
 
+from config import PGN_MAX_ATTACHMENT_SIZE, PGN_MAX_GAMES
+from utils.lichess_api import lichess_api
 from utils.logging_utils import setup_logger, unexpected_error_handler
+from utils.pgn_utils import PgnError, game_title, looks_like_pgn, normalise_game, split_games, split_stream
+
+DISCORD_MESSAGE_LIMIT = 2000
 
 
 class ChessCogs(commands.Cog):
@@ -22,39 +27,97 @@ class ChessCogs(commands.Cog):
     async def on_message(self, message):
         if message.author == self.bot.user:
             return
-        channel = discord.utils.get(
-            self.bot.get_all_channels(), guild__name='Bot', name='chess')
+        channel = self.bot.channel_registry.get('Bot', 'chess')
         if not channel:
             self.logger.critical("Channel not found")
             return
         if message.channel != channel:
             return
-        
+
         self.logger.info("Received message in chess channel")
 
-        if '[Site "Chess.com"]' in message.content:
-            # msg = """"""
-            try:
-                # pgn = re.search(r"^[^\[]+$", message.content,
-                #                 re.MULTILINE).group()
-                pgn = message.content
-                async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
-                    async with session.post("https://lichess.org/api/import", headers={"Accept": "application/json"}, data={"pgn": pgn}) as resp:
-                        self.logger.info("Sending POST request to Lichess with data: " + pgn)
-                        resp_data = await resp.json()
-                        self.logger.info("Lichess import returned: " + str(resp))
-                        if resp.status != 200:
-                            self.logger.critical(
-                                f"Lichess import returned {resp_data}, {resp.status}, {resp.reason}")
-                            await message.channel.send(f"Analysis failed", delete_after=5, ephemeral=True)
-                        else:
-                            self.logger.info("Lichess import returned 200")
-                            await message.channel.send(f"Analysed game: {resp_data['url']}")
-            except Exception as e:
-                unexpected_error_handler(
-                    self.logger, e, message=message.content, resp=resp)
-        else:
+        attachments = [attachment for attachment in message.attachments
+                       if attachment.filename.lower().endswith(".pgn")]
+        if not attachments and not looks_like_pgn(message.content):
             self.logger.info("Message not in PGN format")
+            return
+
+        try:
+            summary = await self.ingest(message.content, attachments)
+            for content in paginate(summary):
+                await message.channel.send(content)
+        except Exception as e:
+            unexpected_error_handler(
+                self.logger, e, message=message.content[:1000], attachments=[a.filename for a in attachments])
+            await message.channel.send("Analysis failed", delete_after=5)
+
+    async def games(self, content: str, attachments: list[discord.Attachment]):
+        """Yield the games pasted in the message, then those of each .pgn attachment as it downloads"""
+        if looks_like_pgn(content):
+            for game in split_games(content):
+                yield game
+        for attachment in attachments:
+            if attachment.size > PGN_MAX_ATTACHMENT_SIZE:
+                yield PgnError(f"{attachment.filename} is larger than {PGN_MAX_ATTACHMENT_SIZE // 1024} KiB")
+                continue
+            async with self.bot.session.get(attachment.url) as resp:
+                resp.raise_for_status()
+                async for game in split_stream(resp.content.iter_chunked(16 * 1024)):
+                    yield game
+
+    async def ingest(self, content: str, attachments: list[discord.Attachment]) -> list[str]:
+        """
+        Import every game of the message to Lichess, queueing each import as soon
+        as its game is read. Return the summary lines.
+        """
+        lines: list[str] = []
+        imports = []
+        analysed = 0
+
+        async def import_game(index: int, pgn: str):
+            nonlocal analysed
+            url = await lichess_api.import_game(pgn)
+            if url:
+                analysed += 1
+                lines[index] = f"{index + 1}. ✅ {game_title(pgn)}: {url}"
+            else:
+                lines[index] = f"{index + 1}. ❌ {game_title(pgn)}: import failed"
+
+        truncated = False
+        # Closing the generator on break also closes the attachment download
+        async with contextlib.aclosing(self.games(content, attachments)) as games:
+            async for game in games:
+                if len(lines) == PGN_MAX_GAMES:
+                    truncated = True
+                    break
+                index = len(lines)
+                try:
+                    if isinstance(game, PgnError):
+                        raise game
+                    pgn = normalise_game(game)
+                except PgnError as e:
+                    lines.append(f"{index + 1}. ⚠️ Skipped: {e}")
+                    continue
+                lines.append("")
+                imports.append(asyncio.create_task(import_game(index, pgn)))
+
+        await asyncio.gather(*imports)
+        summary = [f"Analysed {analysed} of {len(lines)} games"] + lines
+        if truncated:
+            summary.append(f"Only the first {PGN_MAX_GAMES} games were read")
+        return summary
+
+
+def paginate(lines: list[str]) -> list[str]:
+    """Join lines into as few messages as Discord's length limit allows"""
+    pages = []
+    for line in lines:
+        if pages and len(pages[-1]) + len(line) + 1 <= DISCORD_MESSAGE_LIMIT:
+            pages[-1] += "\n" + line
+        else:
+            pages.append(line)
+    return pages
+
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(ChessCogs(bot))
@@ -1,10 +1,11 @@
 import datetime
 import discord
 from discord.ext import commands, tasks
-from config import EASYFRENCH_PLAYLISTID, FEEDBACK_TIMEOUT, RESULT_TIMEOUT
+from config import EASYFRENCH_PLAYLISTID, FEEDBACK_TIMEOUT, FRENCH_SYNC_INTERVAL, RESULT_TIMEOUT
 from utils import french_utils, youtube_utils
 
 from utils.logging_utils import setup_logger, unexpected_error_handler
+from utils.quota_utils import QuotaExceededError, quota
 from views.french.FrenchView import FrenchView
 from views.french.PlaylistConfirmView import PlaylistConfirmView
 from views.french.PlaylistsView import PlaylistsView
@@ -16,6 +17,11 @@ class FrenchCogs(commands.Cog):
         self.bot = bot
         self.logger = setup_logger(__name__)
         self.daily_french.start()
+        self.sync_loop.start()
+
+    async def cog_unload(self):
+        self.daily_french.cancel()
+        self.sync_loop.cancel()
 
 
     @commands.hybrid_group(
@@ -40,19 +46,26 @@ class FrenchCogs(commands.Cog):
                 await ctx.defer()
                 channel = ctx
             else:
-                channel = discord.utils.get(
-                    self.bot.get_all_channels(),
-                    guild__name='Bot',
-                    name='french'
-                )
-            video = await french_utils.random_video()
+                channel = self.bot.channel_registry.get('Bot', 'french')
+            with quota.feature("french" if ctx else "french_daily"):
+                video = await french_utils.random_video()
+            if video is None:
+                self.logger.warning("No French video left to suggest")
+                await channel.send("No video left to suggest", delete_after=FEEDBACK_TIMEOUT)
+                return
 
             await channel.send(
                 content=f"Daily French {youtube_utils.duration_to_str(video['duration'])}: {youtube_utils.videoId_to_url(video['_id'])}",
                 view=FrenchView(video_id=video["_id"])
             )
+        except QuotaExceededError as e:
+            self.logger.warning(str(e))
+            if ctx:
+                await ctx.send(f"YouTube quota exhausted, try again after {discord.utils.format_dt(e.reset_at, 't')}",
+                               delete_after=FEEDBACK_TIMEOUT, ephemeral=True)
         except Exception as e:
-            await ctx.send("Server error", delete_after=FEEDBACK_TIMEOUT, ephemeral=True)
+            if ctx:
+                await ctx.send("Server error", delete_after=FEEDBACK_TIMEOUT, ephemeral=True)
             unexpected_error_handler(self.logger, e)
 
     @french.command(
@@ -64,7 +77,7 @@ class FrenchCogs(commands.Cog):
         try:
             async with ctx.typing(ephemeral=True):
                 per_page = 25
-                playlists = get_playlists(limit=per_page)
+                playlists = await get_playlists.aio(limit=per_page)
                 if len(playlists) == 0:
                     await ctx.send("No playlists found", delete_after=FEEDBACK_TIMEOUT, ephemeral=True)
                 else:
@@ -100,6 +113,17 @@ class FrenchCogs(commands.Cog):
     async def daily_french(self):
         await self.random(None)
 
+    @tasks.loop(hours=FRENCH_SYNC_INTERVAL)
+    async def sync_loop(self):
+        try:
+            # Unchanged playlists and pages are answered 304, so most runs write nothing
+            changed = await french_utils.sync_playlists()
+            self.logger.info(f"Finished French playlist sync, {changed} videos changed")
+        except QuotaExceededError as e:
+            self.logger.warning(str(e))
+        except Exception as e:
+            unexpected_error_handler(self.logger, e)
+
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(FrenchCogs(bot))
\ No newline at end of file
@@ -5,8 +5,14 @@ import discord
 from utils import french_utils
 from utils.logging_utils import setup_logger
 from utils.logging_utils import unexpected_error_handler
-from config import BOT_QUEUE, CALLBACK_URL, FEEDBACK_TIMEOUT, EASYFRENCH_PLAYLISTID
+from config import BOT_QUEUE, CALLBACK_URL, DISPATCH_RETRIES, FEEDBACK_TIMEOUT, RESULT_TIMEOUT, EASYFRENCH_PLAYLISTID
 import utils.youtube_utils as youtube_utils
+from utils.dispatch_utils import PartitionedDispatcher
+from utils.channel_cache import channel_cache
+from utils.quota_utils import quota
+from utils.subscription_utils import subscription_manager
+from utils.lichess_api import lichess_api
+from webhook.signature import signature_stats
 from views.youtube.VideoView import VideoView
 import datetime
 
@@ -18,6 +24,15 @@ class UtilsCogs(commands.Cog):
         self.queue_handlers = {
             "youtube": youtube_utils.queue_handler
         }
+        # Keep one destination and YouTube channel in order, run the others in parallel
+        self.dispatcher = PartitionedDispatcher(
+            handler=self.dispatch_message,
+            key=lambda msg: (msg["type"], msg["data"].get("channelId"))
+        )
+
+    async def cog_unload(self):
+        self.queue_check.cancel()
+        await self.dispatcher.stop()
 
     @commands.hybrid_command(
         description="Ping the bot",
@@ -41,37 +56,98 @@ class UtilsCogs(commands.Cog):
             except AttributeError as e:
                 his_len = 0
 
-    @ tasks.loop(seconds=1)
+    @commands.hybrid_command(
+        description="Display queue statistics",
+        brief="Display queue depth and wait times"
+    )
+    async def stats(self, ctx: commands.Context):
+        report = BOT_QUEUE.report()
+        lines = [
+            f"Queue depth: {report['depth']}, processed: {report['dequeued']} in {report['wakeups']} wakeups, "
+            f"wait avg/max: {report['avg_wait'] * 1000:.1f}/{report['max_wait'] * 1000:.1f} ms"
+        ]
+        if report["unacked"] is not None:
+            lines.append(f"Durable queue: {report['unacked']} unacknowledged, {report['replayed']} replayed at startup")
+        for worker in self.dispatcher.report():
+            lines.append(
+                f"Worker {worker['worker']}: depth {worker['depth']}, processed {worker['processed']}, "
+                f"errors {worker['errors']}, busy {worker['busy']:.1f} s")
+        cache = youtube_utils.seen_videos.report()
+        lines.append(
+            f"Seen videos: {cache['size']} cached, {cache['in_flight']} in flight, hits {cache['hits']} "
+            f"(+{cache['in_flight_hits']} in flight), misses {cache['misses']}, evictions {cache['evictions']}")
+        channels = channel_cache.report()
+        lines.append(
+            f"Channel cache: {channels['size']} channels ({channels['mode']}), hits {channels['hits']}, "
+            f"misses {channels['misses']}, invalidations {channels['invalidations']}, changes {channels['changes']}, "
+            f"reloads {channels['reloads']}")
+        usage = quota.report()
+        lines.append(
+            f"YouTube quota: {usage['used']}/{usage['quota']} units, "
+            f"{'circuit open' if usage['circuit_open'] else 'circuit closed'}, resets {discord.utils.format_dt(usage['reset_at'], 'R')}; "
+            + ", ".join(f"{feature} {units}" for feature, units in usage["usage"].items())
+            + "".join(f", {feature} refused {count}" for feature, count in usage["rejected"].items()))
+        hub = subscription_manager.report()
+        lines.append(
+            f"Hub subscriptions: {hub['renewals']} renewed, {hub['requests']} requests, "
+            f"{hub['retries']} retries, {hub['failures']} failures")
+        chess = lichess_api.report()
+        lines.append(
+            f"Lichess imports: {chess['imports']} imported, {chess['queued']} queued, cache hits {chess['hits']}, "
+            f"misses {chess['misses']}, throttled {chess['throttled']}, failures {chess['failures']}")
+        lines.append("Webhook signatures: " + ", ".join(
+            f"{result} {count}" for result, count in signature_stats.items()))
+        for stage in youtube_utils.notification_pipeline.report():
+            lines.append(
+                f"Stage {stage['stage']}: depth {stage['depth']}, passed {stage['passed']}, completed {stage['completed']}, "
+                f"dropped {stage['dropped']}, retried {stage['retried']}, errors {stage['errors']}, latency avg/max {stage['avg_latency'] * 1000:.1f}/{stage['max_latency'] * 1000:.1f} ms")
+        await ctx.send(
+            "\n".join(lines),
+            ephemeral=True,
+            delete_after=RESULT_TIMEOUT
+        )
+
+    @ tasks.loop(seconds=0)
     async def queue_check(self):
-        if not BOT_QUEUE.empty():
-            msg = BOT_QUEUE.get()
-            try:
-                channel = discord.utils.get(
-                    self.bot.get_all_channels(),
-                    guild__name='Bot',
-                    name=msg["type"]
-                )
-                await self.queue_handlers[msg["type"]](channel, msg["data"])
-            except Exception as e:
-                unexpected_error_handler(self.logger, e)
-                raise e
+        # Sleeps until the webhook thread or a coroutine enqueues something
+        msgs = await BOT_QUEUE.get_batch()
+        self.logger.info(
+            f"Dispatching {len(msgs)} queued messages, {BOT_QUEUE.qsize()} left")
+        for msg in msgs:
+            self.dispatcher.submit(msg)
+
+    async def dispatch_message(self, msg: dict):
+        # Failures are logged and counted by the dispatcher
+        try:
+            channel = self.bot.channel_registry.get('Bot', msg["type"])
+            await self.queue_handlers[msg["type"]](channel, msg["data"])
+        except Exception:
+            self.retry_later(msg)
+            raise
+        BOT_QUEUE.ack(msg)
+
+    def retry_later(self, msg: dict):
+        """Submit a failed message again with exponential backoff; past DISPATCH_RETRIES it waits for the next restart"""
+        attempts = msg.get("attempts", 0) + 1
+        if attempts > DISPATCH_RETRIES:
+            self.logger.error(f"Giving up on {msg} after {DISPATCH_RETRIES} retries")
+            return
+        msg["attempts"] = attempts
+        delay = min(5 * 2 ** (attempts - 1), 300)
+        self.logger.warning(f"Retrying {msg['type']} message in {delay}s")
+        asyncio.get_running_loop().call_later(delay, self.dispatcher.submit, msg)
 
     @ tasks.loop(hours=1)
     async def webhook_check(self):
-        channel = discord.utils.get(
-            self.bot.get_all_channels(),
-            guild__name='Bot',
-            name='debug'
-        )
+        channel = self.bot.channel_registry.get('Bot', 'debug')
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(CALLBACK_URL) as resp:
-                    if resp.status != 200:
-                        self.logger.critical(
-                            f"Webhook callback returned {resp.status}")
-                        await channel.send(f"Webhook callback returned {resp.status}")
-                    else:
-                        self.logger.info("Webhook callback returned 200")
+            async with self.bot.session.get(CALLBACK_URL) as resp:
+                if resp.status != 200:
+                    self.logger.critical(
+                        f"Webhook callback returned {resp.status}")
+                    await channel.send(f"Webhook callback returned {resp.status}")
+                else:
+                    self.logger.info("Webhook callback returned 200")
         except aiohttp.client_exceptions.ClientConnectorError as e:
             await channel.send(f"Cannot connect to webhook callback")
             unexpected_error_handler(self.logger, e)
@@ -81,6 +157,7 @@ class UtilsCogs(commands.Cog):
 
     @ commands.Cog.listener()
     async def on_ready(self):
+        self.dispatcher.start()
         self.queue_check.start()
         self.webhook_check.start()
 
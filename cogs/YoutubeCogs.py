@@ -1,13 +1,13 @@
+import asyncio
 from discord.ext import commands, tasks
 import discord
-import datetime
 from config import FEEDBACK_TIMEOUT, RESULT_TIMEOUT
-from queries.youtube_queries import get_channels
+from queries.youtube_queries import get_channels, get_channels_count
 from utils.logging_utils import setup_logger, unexpected_error_handler
-from google_auth_creds import get_googleapi_credentials
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from utils.youtube_utils import channelId_to_url, duration_to_str, find_missing_videos, request_video_by_id, resubscribe, videoId_to_url
+from utils.youtube_api import YouTubeApiError, youtube_api
+from utils.quota_utils import QuotaExceededError, quota
+from utils.subscription_utils import subscription_manager
+from utils.youtube_utils import channelId_to_url, duration_to_str, find_missing_videos, request_video_by_id, schedule_catch_up, videoId_to_url
 from views.youtube.SubConfirmView import SubConfirmView
 from views.youtube.VideoView import VideoView
 from views.youtube.YoutubeChannelsView import YoutubeChannelsView
@@ -40,11 +40,14 @@ class YoutubeCogs(commands.Cog):
         try:
             async with ctx.typing(ephemeral=True):
                 per_page = 25
-                channels = get_channels(limit=per_page)
+                channels, channels_count = await asyncio.gather(
+                    get_channels.aio(limit=per_page),
+                    get_channels_count.aio()
+                )
                 await ctx.send(
                     content=channelId_to_url(channels[0]["_id"]),
                     view=YoutubeChannelsView(
-                        channels),
+                        channels, channels_count=channels_count),
                     delete_after=RESULT_TIMEOUT,
                     ephemeral=True
                 )
@@ -78,30 +81,34 @@ class YoutubeCogs(commands.Cog):
         interaction: discord.Interaction = ctx.interaction
         await interaction.response.defer(thinking=True, ephemeral=True)
         try:
-            with build('youtube', 'v3', credentials=get_googleapi_credentials()) as youtube:
-                request = youtube.search().list(
+            with quota.feature("search"):
+                response = await youtube_api.search(
                     part="snippet",
                     maxResults=5,
                     q=query,
                     type="channel"
                 )
-                response = request.execute()
-                channels = [{
-                    "_id": channel["snippet"]["channelId"],
-                    "title": channel["snippet"]["title"]
-                } for channel in response["items"]]
-                res = await interaction.followup.send(
-                    content=channelId_to_url(channels[0]["_id"]),
-                    view=YoutubeChannelsView(channels, subscribed=False),
-                    ephemeral=True,
-                    wait=True
-                )
-                await res.delete(delay=RESULT_TIMEOUT)
+            channels = [{
+                "_id": channel["snippet"]["channelId"],
+                "title": channel["snippet"]["title"]
+            } for channel in response["items"]]
+            res = await interaction.followup.send(
+                content=channelId_to_url(channels[0]["_id"]),
+                view=YoutubeChannelsView(channels, subscribed=False),
+                ephemeral=True,
+                wait=True
+            )
+            await res.delete(delay=RESULT_TIMEOUT)
         except discord.errors.HTTPException as e:
             res = await interaction.followup.send("Error searching for channel", wait=True, ephemeral=True)
             unexpected_error_handler(self.logger, e, channels=channels, title_lengths=[
                                      len(channel["title"]) for channel in channels])
             await res.delete(delay=FEEDBACK_TIMEOUT)
+        except QuotaExceededError as e:
+            res = await interaction.followup.send(
+                f"YouTube quota exhausted, try again after {discord.utils.format_dt(e.reset_at, 't')}", ephemeral=True, wait=True)
+            self.logger.warning(str(e))
+            await res.delete(delay=FEEDBACK_TIMEOUT)
         except Exception as e:
             res = await interaction.followup.send("Server error", ephemeral=True, wait=True)
             unexpected_error_handler(self.logger, e)
@@ -115,10 +122,15 @@ class YoutubeCogs(commands.Cog):
         try:
             self.logger.info("Finding missing videos...")
             await ctx.send("Finding missing videos...", ephemeral=True, delete_after=FEEDBACK_TIMEOUT)
-            await find_missing_videos()
-            await ctx.send("Finished finding missing videos", ephemeral=True, delete_after=FEEDBACK_TIMEOUT)
-        except HttpError as e:
-            await ctx.send("Possible quota exceeded", delete_after=FEEDBACK_TIMEOUT, ephemeral=True)
+            queued = await find_missing_videos()
+            await ctx.send(f"Finished finding missing videos, {queued} queued", ephemeral=True, delete_after=FEEDBACK_TIMEOUT)
+        except QuotaExceededError as e:
+            await ctx.send(f"YouTube quota exhausted, missing videos will be checked after {discord.utils.format_dt(e.reset_at, 't')}",
+                           delete_after=FEEDBACK_TIMEOUT, ephemeral=True)
+            self.logger.warning(str(e))
+            schedule_catch_up()
+        except YouTubeApiError as e:
+            await ctx.send("YouTube API error", delete_after=FEEDBACK_TIMEOUT, ephemeral=True)
             unexpected_error_handler(self.logger, e)
         except Exception as e:
             await ctx.send("Server error", delete_after=FEEDBACK_TIMEOUT, ephemeral=True)
@@ -126,14 +138,14 @@ class YoutubeCogs(commands.Cog):
 
     @youtube.command(
         description="Resubscribe",
-        brief="Manually unsubscribe and subscribe to all channels"
+        brief="Manually renew the subscriptions of all channels"
     )
     async def resub(self, ctx: commands.Context):
         try:
             self.logger.info("Resubbing to Youtube channels...")
             await ctx.send("Resubbing to Youtube channels...", ephemeral=True, delete_after=FEEDBACK_TIMEOUT)
-            await resubscribe()
-            await ctx.send("Finished resubbing to Youtube channels", ephemeral=True, delete_after=FEEDBACK_TIMEOUT)
+            renewed = await subscription_manager.renew(force=True)
+            await ctx.send(f"Finished resubbing to Youtube channels, {renewed} renewed", ephemeral=True, delete_after=FEEDBACK_TIMEOUT)
         except Exception as e:
             await ctx.send("Server error", delete_after=FEEDBACK_TIMEOUT, ephemeral=True)
             unexpected_error_handler(self.logger, e)
@@ -162,7 +174,8 @@ class YoutubeCogs(commands.Cog):
                     await msg.delete()
                     channel = msg.channel
                     
-                    response = request_video_by_id(video_id=video_id)
+                    with quota.feature("lookup"):
+                        response = await request_video_by_id(video_id=video_id)
                     if not response:
                         channel.send("Cannot get duration", ephemeral=True)
                         duration = "[]"
@@ -177,11 +190,12 @@ class YoutubeCogs(commands.Cog):
         except Exception as e:
             unexpected_error_handler(self.logger, e, msg=msg.content)
 
-    @ tasks.loop(time=datetime.time(hour=0, minute=0, second=0))
+    @ tasks.loop(hours=1)
     async def resub_loop(self):
         try:
-            await resubscribe()
-            self.logger.info("Finished auto resub")
+            # Only subscriptions close to expiry are renewed, so most runs send nothing
+            renewed = await subscription_manager.renew()
+            self.logger.info(f"Finished auto resub, {renewed} renewed")
         except Exception as e:
             unexpected_error_handler(self.logger, e)
 
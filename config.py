@@ -1,14 +1,37 @@
 import os
 from dotenv import load_dotenv
-import queue
+from utils.queue_utils import DurableQueue, LoopQueue
 
 
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-BOT_QUEUE = queue.Queue()
+
+DATA_PATH = "data/"
+# Persist queued notifications so the ones not yet sent are replayed after a restart
+DURABLE_QUEUE = os.getenv("DURABLE_QUEUE", "false").lower() == "true"
+DURABLE_QUEUE_PATH = os.path.join(DATA_PATH, "bot-queue.sqlite3")
+# Maximum seconds a queued notification may wait before it is fsynced
+DURABLE_QUEUE_FLUSH_INTERVAL = float(os.getenv("DURABLE_QUEUE_FLUSH_INTERVAL", 0.2))
+if DURABLE_QUEUE:
+    os.makedirs(DATA_PATH, exist_ok=True)
+    BOT_QUEUE = LoopQueue(DurableQueue(DURABLE_QUEUE_PATH, flush_interval=DURABLE_QUEUE_FLUSH_INTERVAL))
+else:
+    BOT_QUEUE = LoopQueue()
 
 LOG_FILE = "logs/bioz/runtime.log"
 CALLBACK_URL = os.getenv("CALLBACK_URL")
+# "flask" serves the webhook with waitress in a thread, "async" on the bot's event loop
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "flask")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 5000))
+# hub.secret used to sign pushes; leave empty to accept unsigned pushes
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_SECRET_PER_CHANNEL = os.getenv("WEBHOOK_SECRET_PER_CHANNEL", "false").lower() == "true"
+# Hub subscriptions are renewed when less than SUBSCRIPTION_RENEW_MARGIN seconds of their lease are left
+SUBSCRIPTION_RENEW_MARGIN = int(os.getenv("SUBSCRIPTION_RENEW_MARGIN", 86400))
+SUBSCRIPTION_VERIFY_TIMEOUT = int(os.getenv("SUBSCRIPTION_VERIFY_TIMEOUT", 3600))
+SUBSCRIPTION_CONCURRENCY = int(os.getenv("SUBSCRIPTION_CONCURRENCY", 8))
+SUBSCRIPTION_RETRIES = int(os.getenv("SUBSCRIPTION_RETRIES", 3))
 
 SECRET_PATH = "secrets/"
 os.makedirs(SECRET_PATH, exist_ok=True)
@@ -16,6 +39,8 @@ os.makedirs(SECRET_PATH, exist_ok=True)
 # Edit .gitignore if change these path
 AUTH0_TOKEN_PATH = "secrets/auth0-token.json"
 GOOGLEAPI_TOKEN_PATH = "secrets/google-api-token.pickle"
+# Seconds before expiry at which credentials are refreshed in the background
+GOOGLEAPI_REFRESH_MARGIN = int(os.getenv("GOOGLEAPI_REFRESH_MARGIN", 300))
 
 AUTH0_CLIENT_ID = os.getenv("AUTH0_CLIENT_ID")
 AUTH0_CLIENT_SECRET = os.getenv("AUTH0_CLIENT_SECRET")
@@ -25,10 +50,67 @@ AUTH0_DOMAIN = os.getenv("AUTH0_DOMAIN")
 MONGODB_URI = os.getenv("MONGODB_URI")
 MONGODB_USERNAME = os.getenv("MONGODB_USERNAME")
 MONGODB_PASSWORD = os.getenv("MONGODB_PASSWORD")
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", 10))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", 0))
+
+# Seconds between channel reloads when Mongo change streams are unavailable
+CHANNEL_CACHE_POLL_INTERVAL = int(os.getenv("CHANNEL_CACHE_POLL_INTERVAL", 60))
+
+# Chess channel: Lichess imports in flight, games imported per message, largest .pgn attachment read
+PGN_IMPORT_CONCURRENCY = int(os.getenv("PGN_IMPORT_CONCURRENCY", 2))
+PGN_MAX_GAMES = int(os.getenv("PGN_MAX_GAMES", 50))
+PGN_MAX_ATTACHMENT_SIZE = int(os.getenv("PGN_MAX_ATTACHMENT_SIZE", 5 * 1024 * 1024))
+# Imported games remembered in memory (all are kept in chess.imports), pause after a 429 without Retry-After
+LICHESS_CACHE_SIZE = int(os.getenv("LICHESS_CACHE_SIZE", 1000))
+LICHESS_RETRY_AFTER = float(os.getenv("LICHESS_RETRY_AFTER", 60))
 
 FEEDBACK_TIMEOUT = 5
 RESULT_TIMEOUT = 180
 VIDEO_AGE_LIMIT = 100  # days
+VIDEO_LOOKUP_WINDOW = float(os.getenv("VIDEO_LOOKUP_WINDOW", 0.05))  # seconds
+
+# Bot-wide HTTP session: total and per-host connections, seconds DNS answers are cached
+HTTP_CONNECTIONS = int(os.getenv("HTTP_CONNECTIONS", 100))
+HTTP_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_CONNECTIONS_PER_HOST", 10))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", 300))
+YOUTUBE_API_TIMEOUT = float(os.getenv("YOUTUBE_API_TIMEOUT", 10))  # seconds
+YOUTUBE_API_RETRIES = int(os.getenv("YOUTUBE_API_RETRIES", 3))
+
+# find_missing_videos: channels checked at once, look-back for channels never checked, pages of 50 uploads read per channel
+MISSING_VIDEOS_CONCURRENCY = int(os.getenv("MISSING_VIDEOS_CONCURRENCY", 5))
+MISSING_VIDEOS_LOOKBACK_DAYS = int(os.getenv("MISSING_VIDEOS_LOOKBACK_DAYS", 2))
+MISSING_VIDEOS_MAX_PAGES = int(os.getenv("MISSING_VIDEOS_MAX_PAGES", 4))
+# Hours before the newest checked upload that the next check reads again, for uploads listed late
+MISSING_VIDEOS_OVERLAP_HOURS = int(os.getenv("MISSING_VIDEOS_OVERLAP_HOURS", 6))
+# Daily YouTube Data API units, and the share of them each priority may spend
+YOUTUBE_QUOTA = int(os.getenv("YOUTUBE_QUOTA", 10000))
+YOUTUBE_QUOTA_BUDGETS = {"interactive": 1.0, "realtime": 0.95, "background": 0.7}
+YOUTUBE_QUOTA_FEATURES = {
+    "search": "interactive",
+    "keywords": "interactive",
+    "subscribe": "interactive",
+    "lookup": "interactive",
+    "french": "interactive",
+    "webhook": "realtime",
+    "missing": "background",
+    "french_daily": "background",
+    "french_sync": "background",
+}
+DISPATCH_CONCURRENCY = int(os.getenv("DISPATCH_CONCURRENCY", 4))  # workers sending queued messages
+# Failed messages are retried this many times in process, waiting 5 s, 10 s, 20 s, ... up to 5 minutes
+DISPATCH_RETRIES = int(os.getenv("DISPATCH_RETRIES", 5))
+# Workers per stage of the webhook notification pipeline
+PIPELINE_CONCURRENCY = {"parse": 1, "dedupe": 4, "enrich": 8, "filter": 4, "enqueue": 1}
+# Videos not returned by videos.list yet are looked up again after 30 s, 60 s, 120 s, ...
+PIPELINE_RETRIES = int(os.getenv("PIPELINE_RETRIES", 4))
+PIPELINE_RETRY_DELAY = float(os.getenv("PIPELINE_RETRY_DELAY", 30))
+MAX_NOTIFICATION_SIZE = 1000000  # bytes
+# Recently processed video ids skipped before any network call
+SEEN_VIDEOS_CACHE_SIZE = int(os.getenv("SEEN_VIDEOS_CACHE_SIZE", 10000))
+SEEN_VIDEOS_CACHE_TTL = int(os.getenv("SEEN_VIDEOS_CACHE_TTL", 86400))  # seconds
+# Hours between French playlist syncs, and seconds before an unchanged playlist is walked again anyway
+FRENCH_SYNC_INTERVAL = float(os.getenv("FRENCH_SYNC_INTERVAL", 6))
+FRENCH_SYNC_MAX_AGE = int(os.getenv("FRENCH_SYNC_MAX_AGE", 86400))
 
 DEBUG_CHANNEL = os.getenv("DEBUG_CHANNEL")
 
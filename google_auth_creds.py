@@ -1,8 +1,11 @@
+from datetime import datetime, timedelta, timezone
+import asyncio
+import threading
 from google.auth.transport.requests import Request
-from google.auth.exceptions import OAuthError
+from google.auth.exceptions import OAuthError, RefreshError
 from google.auth import identity_pool
 # from modules import utils
-from utils.logging_utils import setup_logger
+from utils.logging_utils import setup_logger, unexpected_error_handler
 from config import *
 import google.auth
 import requests
@@ -11,10 +14,14 @@ import json
 import os
 
 logger = setup_logger(__name__)
+
+SCOPES = ["https://www.googleapis.com/auth/cloud-platform",
+          "https://www.googleapis.com/auth/youtube.readonly",
+          "https://www.googleapis.com/auth/calendar.events"]
 # Obtain a credential from the trusted identity provider.
 
 
-def request_auth0_token():
+def request_auth0_token() -> dict:
     # if not os.path.exists(AUTH0_TOKEN_PATH):
     auth0_payload = {
         "client_id": AUTH0_CLIENT_ID,
@@ -29,44 +36,146 @@ def request_auth0_token():
         f"{AUTH0_DOMAIN}/oauth/token", auth0_payload, auth0_headers)
 
     auth0_token = auth0_res.json()
-    with open(AUTH0_TOKEN_PATH, "w") as f:
-        json.dump(auth0_token, f)
     logger.info("Auth0 ID token created")
+    return auth0_token
 
 # Exchange the credential for a token from the Security Token Service.
 # Use the token from the Security Token Service to obtain a short-lived Google access token
 # Use the access token to impersonate a service account and call Google APIs
 
 
-def get_googleapi_credentials():
-    SCOPES = ["https://www.googleapis.com/auth/cloud-platform",
-              "https://www.googleapis.com/auth/youtube.readonly",
-              "https://www.googleapis.com/auth/calendar.events"]
+def _utcnow() -> datetime:
+    # google-auth stores expiries as naive UTC datetimes
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class CredentialsHolder:
+    """
+    Keep Google API credentials in memory for the whole process.
+    Credentials are refreshed by a background timer shortly before they expire.
+    Callers that still find them invalid wait on a single shared refresh.
+    The pickle and the Auth0 token file are only written when their content changes.
+    """
+
+    def __init__(self, refresh_margin: int = GOOGLEAPI_REFRESH_MARGIN):
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self._credentials: identity_pool.Credentials = None
+        self._auth0_token: dict = None
+        self._auth0_expiry: datetime = None
+        self._lock = threading.Lock()
+        self._timer: threading.Timer = None
+        self._loaded = False
+
+    def get(self) -> identity_pool.Credentials:
+        credentials = self._credentials
+        if credentials and credentials.valid:
+            return credentials
+
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if not self._credentials or not self._credentials.valid:
+                self._refresh()
+            return self._credentials
 
-    if not os.path.exists(AUTH0_TOKEN_PATH):
-        request_auth0_token()
+    async def aget(self) -> identity_pool.Credentials:
+        """Like get(), but a refresh runs off the event loop"""
+        credentials = self._credentials
+        if credentials and credentials.valid:
+            return credentials
+        return await asyncio.get_running_loop().run_in_executor(None, self.get)
 
-    credentials: identity_pool.Credentials = None
-    if os.path.exists(GOOGLEAPI_TOKEN_PATH) and os.path.getsize(GOOGLEAPI_TOKEN_PATH) > 0:
-        with open(GOOGLEAPI_TOKEN_PATH, "rb") as f:
-            credentials = pickle.load(f)
+    def stop(self) -> None:
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
 
-    if not credentials or not credentials.valid:
+    def _load(self):
+        self._loaded = True
+        if os.path.exists(AUTH0_TOKEN_PATH) and os.path.getsize(AUTH0_TOKEN_PATH) > 0:
+            with open(AUTH0_TOKEN_PATH, "r") as f:
+                self._auth0_token = json.load(f)
+            if "expires_in" in self._auth0_token:
+                self._auth0_expiry = datetime.fromtimestamp(os.path.getmtime(
+                    AUTH0_TOKEN_PATH), timezone.utc).replace(tzinfo=None) + timedelta(seconds=self._auth0_token["expires_in"])
+
+        if os.path.exists(GOOGLEAPI_TOKEN_PATH) and os.path.getsize(GOOGLEAPI_TOKEN_PATH) > 0:
+            with open(GOOGLEAPI_TOKEN_PATH, "rb") as f:
+                self._credentials = pickle.load(f)
+            logger.info("Loaded Google API credentials from disk")
+            if self._credentials.valid:
+                self._schedule_refresh()
+
+    def _ensure_auth0_token(self, force: bool = False):
+        if not force and self._auth0_token and self._auth0_expiry and self._auth0_expiry - self.refresh_margin > _utcnow():
+            return
         logger.info("Refreshing auth0 token")
-        request_auth0_token()
-        if credentials and credentials.expired:
+        auth0_token = request_auth0_token()
+        if "expires_in" in auth0_token:
+            self._auth0_expiry = _utcnow() + timedelta(seconds=auth0_token["expires_in"])
+        if auth0_token != self._auth0_token:
+            with open(AUTH0_TOKEN_PATH, "w") as f:
+                json.dump(auth0_token, f)
+            self._auth0_token = auth0_token
+
+    def _refresh(self):
+        """Refresh the credentials. The caller must hold self._lock."""
+        old_token = self._credentials.token if self._credentials else None
+        self._ensure_auth0_token()
+        try:
+            self._refresh_credentials()
+        except (OAuthError, RefreshError):
+            # The identity provider may have revoked the subject token early
+            logger.info("Refreshing credentials failed, retrying with a new auth0 token")
+            self._ensure_auth0_token(force=True)
+            self._refresh_credentials()
+
+        if self._credentials.token != old_token:
+            with open(GOOGLEAPI_TOKEN_PATH, "wb") as f:
+                pickle.dump(self._credentials, f)
+        self._schedule_refresh()
+
+    def _refresh_credentials(self):
+        if self._credentials:
             logger.info("Refreshing credentials")
-            credentials.refresh(Request())
-            # try:
-            # except OAuthError:
-            #     credentials.refresh
+            self._credentials.refresh(Request())
         else:
-            credentials, project = google.auth.default(scopes=SCOPES)
-            # try:
-            # except OAuthError:
-            #     logger.info("Refreshing auth0 token")
-            #     request_auth0_token()
-            #     credentials, project = google.auth.default(scopes=SCOPES)
-        with open(GOOGLEAPI_TOKEN_PATH, "wb") as f:
-            pickle.dump(credentials, f)
-    return credentials
+            self._credentials, project = google.auth.default(scopes=SCOPES)
+            if not self._credentials.valid:
+                self._credentials.refresh(Request())
+
+    def _schedule_refresh(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if not self._credentials.expiry:
+            return
+        delay = (self._credentials.expiry - self.refresh_margin - _utcnow()).total_seconds()
+        self._timer = threading.Timer(max(delay, 30), self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+        try:
+            with self._lock:
+                self._refresh()
+            logger.info("Refreshed Google API credentials in background")
+        except Exception as e:
+            # get() will retry on the next request
+            unexpected_error_handler(logger, e)
+
+
+_holder = CredentialsHolder()
+
+
+def get_googleapi_credentials() -> identity_pool.Credentials:
+    return _holder.get()
+
+
+async def get_googleapi_credentials_async() -> identity_pool.Credentials:
+    return await _holder.aget()
+
+
+def stop_credentials_refresh() -> None:
+    _holder.stop()
@@ -1,17 +1,32 @@
 import asyncio
 from Bioz import Bioz
-from webhook.webhook import app
 from threading import Thread
 from utils.logging_utils import setup_logger
-from config import BOT_TOKEN
-from waitress import serve
-from paste.translogger import TransLogger
+from config import BOT_TOKEN, WEBHOOK_HOST, WEBHOOK_MODE, WEBHOOK_PORT
 
 bot = Bioz()
 
 
 async def main():
-    await bot.start(BOT_TOKEN)
+    async with bot:
+        runner = None
+        if WEBHOOK_MODE == "async":
+            from webhook.async_webhook import start_server
+            runner = await start_server(WEBHOOK_HOST, WEBHOOK_PORT)
+        try:
+            await bot.start(BOT_TOKEN)
+        finally:
+            if runner:
+                await runner.cleanup()
+
+
+def start_flask_webhook():
+    from webhook.webhook import app
+    from waitress import serve
+    from paste.translogger import TransLogger
+    Thread(target=serve, args=(TransLogger(app, setup_console_handler=False),), kwargs={
+        'host': WEBHOOK_HOST, 'port': WEBHOOK_PORT}, daemon=True).start()
+
 
 if __name__ == '__main__':
     setup_logger("discord")
@@ -20,8 +35,10 @@ if __name__ == '__main__':
     setup_logger("wsgi")
     logger = setup_logger(__name__)
     try:
-        t = Thread(target=serve, args=(TransLogger(app, setup_console_handler=False),),kwargs={
-            'host': '0.0.0.0', 'port': 5000}, daemon=True).start()
+        if WEBHOOK_MODE == "flask":
+            start_flask_webhook()
+        elif WEBHOOK_MODE != "async":
+            raise ValueError(f"Unknown WEBHOOK_MODE: {WEBHOOK_MODE}")
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info('Keyboard Interrupt detected. Exiting...')
@@ -0,0 +1,26 @@
+import datetime
+import pymongo
+
+from utils.database_utils import query
+from utils.logging_utils import setup_logger, unexpected_error_handler
+
+logger = setup_logger(__name__)
+
+@query(db="chess", collection="imports")
+def get_import_url(pgn_hash: str, collection: pymongo.collection.Collection) -> str:
+    try:
+        imported = collection.find_one({"_id": pgn_hash}, {"url": 1})
+        return imported["url"] if imported else None
+    except Exception as e:
+        unexpected_error_handler(logger, e, pgn_hash=pgn_hash)
+
+@query(db="chess", collection="imports")
+def add_import(pgn_hash: str, url: str, collection: pymongo.collection.Collection) -> None:
+    try:
+        collection.update_one(
+            {"_id": pgn_hash},
+            {"$set": {"url": url, "importedAt": int(datetime.datetime.now().timestamp())}},
+            upsert=True
+        )
+    except Exception as e:
+        unexpected_error_handler(logger, e, pgn_hash=pgn_hash, url=url)
@@ -75,9 +75,136 @@ def update_watch(video_id: str, collection: pymongo.collection.Collection) -> No
     except Exception as e:
         unexpected_error_handler(logger, e)
 
+
+# Playlist items anyone can watch; deleted items have no privacy status
+PLAYABLE = ["public", "unlisted"]
+
+
+@query(db="french", collection="videos")
+def mark_legacy_videos_suggested(collection: pymongo.collection.Collection) -> int:
+    """Videos stored before the playlist mirror existed were all suggested already"""
+    try:
+        return collection.update_many(
+            {"positions": {"$exists": False}, "suggestedAt": {"$exists": False}},
+            {"$set": {"suggestedAt": 0}}
+        ).modified_count
+    except Exception as e:
+        unexpected_error_handler(logger, e)
+
+@query(db="french", collection="videos")
+def mirror_playlist_items(playlist_id: str, items: list[dict], collection: pymongo.collection.Collection) -> None:
+    """Upsert playlist items given as {_id, position, privacy, title}"""
+    try:
+        if items:
+            collection.bulk_write([
+                pymongo.UpdateOne(
+                    {"_id": item["_id"]},
+                    {"$set": {
+                        f"positions.{playlist_id}": item["position"],
+                        "privacy": item["privacy"],
+                        "title": item["title"],
+                    }},
+                    upsert=True
+                ) for item in items
+            ], ordered=False)
+    except Exception as e:
+        unexpected_error_handler(logger, e, playlist_id=playlist_id)
+
+@query(db="french", collection="videos")
+def unmirror_playlist_items(playlist_id: str, video_ids: list[str], collection: pymongo.collection.Collection) -> None:
+    try:
+        if video_ids:
+            collection.update_many({"_id": {"$in": video_ids}}, {"$unset": {f"positions.{playlist_id}": ""}})
+    except Exception as e:
+        unexpected_error_handler(logger, e, playlist_id=playlist_id)
+
+@query(db="french", collection="videos")
+def get_videos_without_duration(video_ids: list[str], collection: pymongo.collection.Collection) -> list[str]:
+    try:
+        return [video["_id"] for video in collection.find(
+            {"_id": {"$in": video_ids}, "privacy": {"$in": PLAYABLE}, "duration": {"$exists": False}},
+            {"_id": 1}
+        )]
+    except Exception as e:
+        unexpected_error_handler(logger, e)
+        return []
+
 @query(db="french", collection="videos")
-def add_video(video: dict[str, str], collection: pymongo.collection.Collection) -> None:
+def update_videos(updates: dict[str, dict], collection: pymongo.collection.Collection) -> None:
+    """Set fields on many videos, given as {video_id: fields}"""
     try:
-        return collection.insert_one(video).inserted_id
+        if updates:
+            collection.bulk_write([
+                pymongo.UpdateOne({"_id": video_id}, {"$set": fields}) for video_id, fields in updates.items()
+            ], ordered=False)
     except Exception as e:
-        unexpected_error_handler(logger, e)
\ No newline at end of file
+        unexpected_error_handler(logger, e)
+
+@query(db="french", collection="videos")
+def get_playable_video_ids(playlist_id: str, collection: pymongo.collection.Collection, unsuggested: bool = True) -> list[str]:
+    try:
+        conditions = {
+            f"positions.{playlist_id}": {"$exists": True},
+            "privacy": {"$in": PLAYABLE},
+            "duration": {"$exists": True},
+        }
+        if unsuggested:
+            conditions["suggestedAt"] = {"$exists": False}
+        return [video["_id"] for video in collection.find(conditions, {"_id": 1})]
+    except Exception as e:
+        unexpected_error_handler(logger, e, playlist_id=playlist_id)
+        return []
+
+# One document per playlist, {_id: playlist id, order, cursor, size, shuffledAt},
+# kept apart from french.playlists so listing playlists never loads the permutations
+@query(db="french", collection="shuffles")
+def replace_exhausted_shuffle(playlist_id: str, order: list[str], collection: pymongo.collection.Collection) -> bool:
+    """Store a new permutation unless the current one still has videos left, e.g. after a concurrent reshuffle"""
+    try:
+        result = collection.update_one(
+            {"_id": playlist_id, "$expr": {"$gte": ["$cursor", "$size"]}},
+            {"$set": {
+                "order": order,
+                "cursor": 0,
+                "size": len(order),
+                "shuffledAt": int(datetime.datetime.now().timestamp()),
+            }},
+            upsert=True
+        )
+        return result.matched_count == 1 or result.upserted_id is not None
+    except pymongo.errors.DuplicateKeyError:
+        # The upsert found a permutation that is not exhausted
+        return False
+    except Exception as e:
+        unexpected_error_handler(logger, e, playlist_id=playlist_id)
+
+@query(db="french", collection="shuffles")
+def claim_shuffle_position(playlist_id: str, collection: pymongo.collection.Collection) -> dict:
+    """Advance the cursor atomically and return the permutation state before it, or None once exhausted"""
+    try:
+        return collection.find_one_and_update(
+            {"_id": playlist_id, "$expr": {"$lt": ["$cursor", "$size"]}},
+            {"$inc": {"cursor": 1}},
+            projection={"cursor": 1, "shuffledAt": 1},
+            return_document=pymongo.ReturnDocument.BEFORE
+        )
+    except Exception as e:
+        unexpected_error_handler(logger, e, playlist_id=playlist_id)
+
+@query(db="french", collection="shuffles")
+def get_shuffled_video_id(playlist_id: str, index: int, collection: pymongo.collection.Collection) -> str:
+    """Read one entry of the permutation; only that id leaves the server"""
+    try:
+        return next(collection.aggregate([
+            {"$match": {"_id": playlist_id}},
+            {"$project": {"_id": 0, "videoId": {"$arrayElemAt": ["$order", index]}}},
+        ]))["videoId"]
+    except Exception as e:
+        unexpected_error_handler(logger, e, playlist_id=playlist_id, index=index)
+
+@query(db="french", collection="videos")
+def mark_suggested(video_id: str, collection: pymongo.collection.Collection) -> None:
+    try:
+        collection.update_one({"_id": video_id}, {"$set": {"suggestedAt": int(datetime.datetime.now().timestamp())}})
+    except Exception as e:
+        unexpected_error_handler(logger, e)
@@ -2,6 +2,7 @@
 from datetime import datetime
 import pymongo
 from config import DEBUG_CHANNEL
+from utils.channel_cache import channel_cache
 from utils.database_utils import query
 from utils.logging_utils import setup_logger, unexpected_error_handler
 
@@ -12,6 +13,7 @@ logger = setup_logger(__name__)
 def add_channel(channel: dict[str, str], collection: pymongo.collection.Collection) -> None:
     try:
         collection.insert_one(channel)
+        channel_cache.invalidate(channel["_id"])
     except Exception as e:
         unexpected_error_handler(logger, e)
 
@@ -40,7 +42,9 @@ def get_channels(collection: pymongo.collection.Collection, start_title: str = "
 @query(db="youtube", collection="channels")
 def update_channel_by_id(channel_id: str, channel: dict[str, str], collection: pymongo.collection.Collection) -> pymongo.results.UpdateResult:
     try:
-        return collection.update_one({"_id": channel_id}, {"$set": channel})
+        result = collection.update_one({"_id": channel_id}, {"$set": channel})
+        channel_cache.invalidate(channel_id)
+        return result
     except Exception as e:
         unexpected_error_handler(logger, e)
 
@@ -48,7 +52,9 @@ def update_channel_by_id(channel_id: str, channel: dict[str, str], collection: p
 @ query(db="youtube", collection="channels")
 def remove_channel(channel_id: str, collection: pymongo.collection.Collection) -> pymongo.results.DeleteResult:
     try:
-        return collection.delete_one({"_id": channel_id})
+        result = collection.delete_one({"_id": channel_id})
+        channel_cache.invalidate(channel_id)
+        return result
     except Exception as e:
         unexpected_error_handler(logger, e)
 
@@ -61,6 +67,23 @@ def get_channel_by_id(chanel_id: str, collection: pymongo.collection.Collection)
         unexpected_error_handler(logger, e)
 
 
+@ query(db="youtube", collection="subscriptions")
+def get_subscriptions(collection: pymongo.collection.Collection) -> list[dict]:
+    try:
+        return list(collection.find())
+    except Exception as e:
+        unexpected_error_handler(logger, e)
+        return []
+
+
+@ query(db="youtube", collection="subscriptions")
+def update_subscription(channel_id: str, fields: dict, collection: pymongo.collection.Collection) -> pymongo.results.UpdateResult:
+    try:
+        return collection.update_one({"_id": channel_id}, {"$set": fields}, upsert=True)
+    except Exception as e:
+        unexpected_error_handler(logger, e, channel_id=channel_id)
+
+
 @ query(db="youtube", collection="videos")
 def add_video(video: dict[str, str], collection: pymongo.collection.Collection) -> str:
     try:
@@ -73,6 +96,14 @@ def add_video(video: dict[str, str], collection: pymongo.collection.Collection)
         unexpected_error_handler(logger, e, video=video)
 
 
+@ query(db="youtube", collection="videos")
+def mark_video_sent(video_id: str, collection: pymongo.collection.Collection) -> None:
+    try:
+        collection.update_one({"_id": video_id}, {"$set": {"sentAt": int(datetime.now().timestamp())}})
+    except Exception as e:
+        unexpected_error_handler(logger, e, video_id=video_id)
+
+
 @ query(db="youtube", collection="videos")
 def get_videos(collection: pymongo.collection.Collection) -> list[dict[str, str]]:
     try:
@@ -89,6 +120,35 @@ def get_video_by_id(video_id: str, collection: pymongo.collection.Collection) ->
         unexpected_error_handler(logger, e)
 
 
+@ query(db="youtube", collection="videos")
+def get_existing_video_ids(video_ids: list[str], collection: pymongo.collection.Collection) -> set[str]:
+    try:
+        # Videos stored but not sent yet (sentAt null) still count as missing
+        return {video["_id"] for video in collection.find(
+            {"_id": {"$in": video_ids}, "sentAt": {"$not": {"$type": "null"}}}, {"_id": 1})}
+    except Exception as e:
+        unexpected_error_handler(logger, e, video_ids=video_ids)
+        return set()
+
+
+@ query(db="youtube", collection="videos")
+def get_video_titles_by_channelId(channel_id: str, collection: pymongo.collection.Collection) -> list[str]:
+    try:
+        cursor = collection.find({"channelId": channel_id}, {"_id": 0, "title": 1}, batch_size=10000)
+        return [video["title"] for video in cursor if "title" in video]
+    except Exception as e:
+        unexpected_error_handler(logger, e, channel_id=channel_id)
+
+
+@ query(db="youtube", collection="videos")
+def create_video_indexes(collection: pymongo.collection.Collection):
+    try:
+        # Covers the per-channel title scan used to backtest keywords
+        collection.create_index([("channelId", pymongo.ASCENDING), ("title", pymongo.ASCENDING)])
+    except Exception as e:
+        unexpected_error_handler(logger, e)
+
+
 @ query(db="youtube", collection="videos")
 def update_watched_at(video_id: str, collection: pymongo.collection.Collection):
     try:
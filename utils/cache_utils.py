@@ -0,0 +1,54 @@
+import collections
+import time
+
+
+class RecentIdCache:
+    """
+    Remember recently processed ids for `ttl` seconds, keeping at most `maxsize`
+    of them (least recently seen are evicted first).
+    claim() returns False for an id that is recent or is being processed right now,
+    otherwise it marks the id in flight and returns True. The claimer then calls
+    done() to make the id recent, or forget() to let a later delivery retry it.
+    In-flight claims that are never released expire after `ttl` as well.
+    Not thread-safe: use it from the event loop only.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._recent: collections.OrderedDict[str, float] = collections.OrderedDict()
+        self._in_flight: dict[str, float] = {}
+        self.stats = {"hits": 0, "in_flight_hits": 0, "misses": 0, "evictions": 0}
+
+    def claim(self, key: str) -> bool:
+        now = time.monotonic()
+        expiry = self._recent.get(key)
+        if expiry is not None:
+            if expiry > now:
+                self.stats["hits"] += 1
+                self._recent.move_to_end(key)
+                return False
+            del self._recent[key]
+
+        deadline = self._in_flight.get(key)
+        if deadline is not None and deadline > now:
+            self.stats["in_flight_hits"] += 1
+            return False
+
+        self.stats["misses"] += 1
+        self._in_flight[key] = now + self.ttl
+        return True
+
+    def done(self, key: str) -> None:
+        self._in_flight.pop(key, None)
+        self._recent[key] = time.monotonic() + self.ttl
+        self._recent.move_to_end(key)
+        while len(self._recent) > self.maxsize:
+            self._recent.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def forget(self, key: str) -> None:
+        self._in_flight.pop(key, None)
+
+    def report(self) -> dict:
+        return {"size": len(self._recent), "in_flight": len(self._in_flight), **self.stats}
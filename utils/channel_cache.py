@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import pymongo
+from config import CHANNEL_CACHE_POLL_INTERVAL
+from utils.database_utils import get_client, get_executor
+from utils.logging_utils import setup_logger, unexpected_error_handler
+
+logger = setup_logger(__name__)
+
+
+class ChannelCache:
+    """
+    In-process copy of the youtube.channels documents, read on every notification.
+    Local writes invalidate single entries (see queries.youtube_queries). Writes from
+    other processes arrive through a change stream, or, where change streams are not
+    supported, through a full reload every CHANNEL_CACHE_POLL_INTERVAL seconds.
+    Cached documents are shared: callers must not modify them.
+    """
+
+    def __init__(self, db: str = "youtube", collection: str = "channels"):
+        self.db = db
+        self.collection = collection
+        self._channels: dict[str, dict] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._watcher: threading.Thread = None
+        self.mode = "stopped"
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "reloads": 0, "changes": 0}
+
+    def _collection(self) -> pymongo.collection.Collection:
+        return get_client()[self.db][self.collection]
+
+    async def start(self) -> None:
+        """Load every channel, then follow changes in a background thread"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(get_executor(), self._reload)
+        self._stopped.clear()
+        self._watcher = threading.Thread(target=self._watch, name="channel-cache", daemon=True)
+        self._watcher.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    async def get(self, channel_id: str) -> dict:
+        """Return the channel document, or None if the channel is not stored"""
+        with self._lock:
+            if channel_id in self._channels:
+                self.stats["hits"] += 1
+                return self._channels[channel_id]
+            self.stats["misses"] += 1
+            generation = self._generation
+
+        loop = asyncio.get_running_loop()
+        channel = await loop.run_in_executor(get_executor(), self._fetch, channel_id)
+        with self._lock:
+            # Do not cache a read that raced with an invalidation
+            if generation == self._generation:
+                self._channels[channel_id] = channel
+        return channel
+
+    def invalidate(self, channel_id: str) -> None:
+        """Drop one channel, so the next get() reads it from the database. Thread-safe."""
+        with self._lock:
+            self._channels.pop(channel_id, None)
+            self._generation += 1
+            self.stats["invalidations"] += 1
+
+    def _fetch(self, channel_id: str) -> dict:
+        return self._collection().find_one({"_id": channel_id})
+
+    def _reload(self) -> None:
+        channels = {channel["_id"]: channel for channel in self._collection().find()}
+        with self._lock:
+            self._channels = channels
+            self._generation += 1
+            self.stats["reloads"] += 1
+
+    def _watch(self) -> None:
+        try:
+            self.mode = "change stream"
+            with self._collection().watch(full_document="updateLookup", max_await_time_ms=1000) as stream:
+                # Changes made between the initial load and opening the stream
+                self._reload()
+                while not self._stopped.is_set() and stream.alive:
+                    change = stream.try_next()
+                    if change is not None:
+                        self._apply(change)
+        except pymongo.errors.OperationFailure as e:
+            logger.warning(f"Change streams unavailable, polling channels instead: {e}")
+        except Exception as e:
+            unexpected_error_handler(logger, e)
+        if not self._stopped.is_set():
+            self._poll()
+        self.mode = "stopped"
+
+    def _apply(self, change: dict) -> None:
+        operation = change["operationType"]
+        if operation in ("drop", "rename", "dropDatabase", "invalidate"):
+            self._reload()
+            return
+        channel_id = change["documentKey"]["_id"]
+        with self._lock:
+            if operation == "delete" or change.get("fullDocument") is None:
+                self._channels.pop(channel_id, None)
+            else:
+                self._channels[channel_id] = change["fullDocument"]
+            self._generation += 1
+            self.stats["changes"] += 1
+
+    def _poll(self) -> None:
+        self.mode = "polling"
+        while not self._stopped.wait(CHANNEL_CACHE_POLL_INTERVAL):
+            try:
+                self._reload()
+            except Exception as e:
+                unexpected_error_handler(logger, e)
+
+    def report(self) -> dict:
+        with self._lock:
+            return {"size": len(self._channels), "mode": self.mode, **self.stats}
+
+
+channel_cache = ChannelCache()
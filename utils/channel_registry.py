@@ -0,0 +1,59 @@
+import discord
+
+
+class ChannelRegistry:
+    """
+    Index the guild channels the client can see by (guild name, channel name) and by id.
+    Lookups are O(1), instead of the linear scan of
+    discord.utils.get(client.get_all_channels(), ...).
+    The index is built on first use or at ready. The client's guild and channel
+    events re-index only the guild they concern. Where names clash, the first
+    channel of the guild wins, as with discord.utils.get.
+    """
+
+    def __init__(self, client: discord.Client):
+        self.client = client
+        self.built = False
+        self._by_id: dict[int, discord.abc.GuildChannel] = {}
+        self._by_name: dict[tuple[str, str], discord.abc.GuildChannel] = {}
+        self._guild_entries: dict[int, tuple[list[int], list[tuple[str, str]]]] = {}
+
+    def build(self) -> None:
+        self._by_id.clear()
+        self._by_name.clear()
+        self._guild_entries.clear()
+        for guild in self.client.guilds:
+            self.index_guild(guild)
+        self.built = True
+
+    def index_guild(self, guild: discord.Guild) -> None:
+        self.forget_guild(guild.id)
+        ids, names = [], []
+        for channel in guild.channels:
+            self._by_id[channel.id] = channel
+            ids.append(channel.id)
+            key = (guild.name, channel.name)
+            if key not in self._by_name:
+                self._by_name[key] = channel
+                names.append(key)
+        self._guild_entries[guild.id] = (ids, names)
+
+    def forget_guild(self, guild_id: int) -> None:
+        ids, names = self._guild_entries.pop(guild_id, ((), ()))
+        for channel_id in ids:
+            self._by_id.pop(channel_id, None)
+        for key in names:
+            self._by_name.pop(key, None)
+
+    def get(self, guild_name: str, name: str) -> discord.abc.GuildChannel:
+        if not self.built:
+            self.build()
+        return self._by_name.get((guild_name, name))
+
+    def get_by_id(self, channel_id: int) -> discord.abc.GuildChannel:
+        if not self.built:
+            self.build()
+        return self._by_id.get(channel_id)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
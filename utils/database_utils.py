@@ -1,15 +1,77 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pymongo
-from config import MONGODB_PASSWORD, MONGODB_USERNAME, MONGODB_URI
+from config import MONGODB_PASSWORD, MONGODB_USERNAME, MONGODB_URI, MONGODB_MAX_POOL_SIZE, MONGODB_MIN_POOL_SIZE
+
+_client: pymongo.MongoClient = None
+_client_lock = threading.Lock()
+_executor: ThreadPoolExecutor = None
+
+
+def get_client() -> pymongo.MongoClient:
+    """
+    Return the process-wide MongoClient, creating it on first use.
+    The client is thread-safe and keeps its own connection pool, so it is shared
+    by the bot loop and the webhook threads instead of reconnecting per query.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = pymongo.MongoClient(
+                    f"mongodb+srv://{MONGODB_USERNAME}:{MONGODB_PASSWORD}@{MONGODB_URI}/?retryWrites=true&w=majority",
+                    maxPoolSize=MONGODB_MAX_POOL_SIZE,
+                    minPoolSize=MONGODB_MIN_POOL_SIZE,
+                )
+    return _client
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Return the executor used by awaitable queries.
+    It has as many workers as the client has connections, so queued queries wait
+    here instead of piling up on the pool.
+    """
+    global _executor
+    if _executor is None:
+        with _client_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=MONGODB_MAX_POOL_SIZE, thread_name_prefix="mongodb")
+    return _executor
+
+
+def close_client() -> None:
+    """Close the shared MongoClient and executor. The next query lazily opens new ones."""
+    global _client, _executor
+    with _client_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+        if _client is not None:
+            _client.close()
+            _client = None
 
 
 def query(db: str, collection: str):
+    """
+    Inject the collection into the decorated function.
+    The decorated function also gets an awaitable variant, `func.aio`, which runs
+    the query on the bounded executor so coroutines never block the event loop.
+    """
     def inner(func):
+        @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            client = pymongo.MongoClient(
-                f"mongodb+srv://{MONGODB_USERNAME}:{MONGODB_PASSWORD}@{MONGODB_URI}/?retryWrites=true&w=majority")
-            kwargs["collection"] = client[db][collection]
-            result = func(*args, **kwargs)
-            client.close()
-            return result
+            kwargs["collection"] = get_client()[db][collection]
+            return func(*args, **kwargs)
+
+        @functools.wraps(func)
+        async def aio(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(get_executor(), functools.partial(wrapper, *args, **kwargs))
+
+        wrapper.aio = aio
         return wrapper
     return inner
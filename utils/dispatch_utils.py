@@ -0,0 +1,220 @@
+import asyncio
+import threading
+import time
+from typing import Awaitable, Callable, Hashable
+
+from config import DISPATCH_CONCURRENCY, PIPELINE_RETRIES, PIPELINE_RETRY_DELAY
+from utils.logging_utils import setup_logger, unexpected_error_handler
+
+logger = setup_logger(__name__)
+
+
+class PartitionedDispatcher:
+    """
+    Run a handler over submitted items with `concurrency` workers.
+    Items are partitioned by `key(item)`: every item of a partition goes to the same
+    worker, so they are handled in submission order, while other partitions proceed
+    in parallel on the other workers.
+    """
+
+    def __init__(self, handler: Callable[[dict], Awaitable], key: Callable[[dict], Hashable], concurrency: int = DISPATCH_CONCURRENCY):
+        self.handler = handler
+        self.key = key
+        self.concurrency = concurrency
+        self._queues: list[asyncio.Queue] = [asyncio.Queue() for _ in range(concurrency)]
+        self._workers: list[asyncio.Task] = []
+        self.stats = [
+            {"processed": 0, "errors": 0, "busy": 0.0} for _ in range(concurrency)
+        ]
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._workers = [
+            asyncio.create_task(self._work(index), name=f"dispatcher-{index}")
+            for index in range(self.concurrency)
+        ]
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, item: dict) -> None:
+        index = hash(self.key(item)) % self.concurrency
+        self._queues[index].put_nowait(item)
+
+    async def _work(self, index: int):
+        queue = self._queues[index]
+        stats = self.stats[index]
+        while True:
+            item = await queue.get()
+            start = time.monotonic()
+            try:
+                await self.handler(item)
+            except Exception as e:
+                stats["errors"] += 1
+                unexpected_error_handler(logger, e, worker=index, item=str(item))
+            finally:
+                stats["processed"] += 1
+                stats["busy"] += time.monotonic() - start
+                queue.task_done()
+
+    def report(self) -> list[dict]:
+        return [
+            {"worker": index, "depth": queue.qsize(), **stats}
+            for index, (queue, stats) in enumerate(zip(self._queues, self.stats))
+        ]
+
+
+class RetryLater(Exception):
+    """
+    Raised by a stage function to drop an item without deciding its fate,
+    e.g. after a transient failure: on_error is called instead of on_done so the
+    item can be processed again. With `resubmit`, the pipeline first runs the
+    item through the same stage again, with backoff, up to its `retries` times.
+    """
+
+    def __init__(self, message: str, resubmit: bool = False):
+        super().__init__(message)
+        self.resubmit = resubmit
+
+
+class Stage:
+    def __init__(self, name: str, func: Callable[[object], Awaitable[list]], concurrency: int):
+        self.name = name
+        self.func = func
+        self.concurrency = concurrency
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.stats = {
+            "processed": 0,
+            "passed": 0,
+            "completed": 0,
+            "dropped": 0,
+            "retried": 0,
+            "errors": 0,
+            "total_latency": 0.0,
+            "max_latency": 0.0,
+        }
+
+
+class StagedPipeline:
+    """
+    Run items through a chain of async stages.
+    Each stage has its own queue and `concurrency` workers, so a slow stage only
+    backs up its own queue. A stage function returns the items for the next stage:
+    an empty list drops the item, several items fan out. The last stage returns
+    the items it completed, so they are not counted as dropped.
+    on_done(item) is called when an item leaves the pipeline for good (dropped, or
+    through the last stage) and on_error(item) when a stage raised on it,
+    including RetryLater. Items resubmitted by RetryLater wait retry_delay,
+    then twice as long each time, before going through the stage again.
+    submit() can be called from any thread; items submitted before start() are kept.
+    """
+
+    def __init__(self, stages: list[tuple[str, Callable[[object], Awaitable[list]], int]], on_done: Callable[[object], None] = None, on_error: Callable[[object], None] = None,
+                 retries: int = PIPELINE_RETRIES, retry_delay: float = PIPELINE_RETRY_DELAY):
+        self.stages = [Stage(name, func, concurrency) for name, func, concurrency in stages]
+        self.on_done = on_done
+        self.on_error = on_error
+        self.retries = retries
+        self.retry_delay = retry_delay
+        # Resubmissions so far, by id() of the item, while it is being retried
+        self._attempts: dict[int, int] = {}
+        self._loop: asyncio.AbstractEventLoop = None
+        self._backlog = []
+        self._lock = threading.Lock()
+        self._workers: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        for index, stage in enumerate(self.stages):
+            self._workers += [
+                asyncio.create_task(self._work(index), name=f"{stage.name}-{worker}")
+                for worker in range(stage.concurrency)
+            ]
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            for item in self._backlog:
+                self.stages[0].queue.put_nowait(item)
+            self._backlog.clear()
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, item) -> None:
+        with self._lock:
+            if self._loop is None:
+                self._backlog.append(item)
+                return
+            loop = self._loop
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is loop:
+            self.stages[0].queue.put_nowait(item)
+        else:
+            loop.call_soon_threadsafe(self.stages[0].queue.put_nowait, item)
+
+    async def _work(self, index: int):
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        stats = stage.stats
+        while True:
+            item = await stage.queue.get()
+            start = time.monotonic()
+            try:
+                results = await stage.func(item) or []
+                self._attempts.pop(id(item), None)
+                if not results:
+                    stats["dropped"] += 1
+                elif next_stage:
+                    stats["passed"] += 1
+                else:
+                    stats["completed"] += 1
+                if next_stage:
+                    for result in results:
+                        next_stage.queue.put_nowait(result)
+                if (not results or not next_stage) and self.on_done:
+                    self.on_done(item)
+            except RetryLater as e:
+                attempt = self._attempts.get(id(item), 0)
+                if e.resubmit and attempt < self.retries:
+                    self._attempts[id(item)] = attempt + 1
+                    delay = self.retry_delay * 2 ** attempt
+                    stats["retried"] += 1
+                    logger.warning(f"Stage {stage.name} will retry in {delay}s: {e}")
+                    asyncio.get_running_loop().call_later(delay, stage.queue.put_nowait, item)
+                else:
+                    self._attempts.pop(id(item), None)
+                    logger.warning(f"Stage {stage.name} dropped an item to retry later: {e}")
+                    if self.on_error:
+                        self.on_error(item)
+            except Exception as e:
+                stats["errors"] += 1
+                unexpected_error_handler(logger, e, stage=stage.name, item=str(item))
+                if self.on_error:
+                    self.on_error(item)
+            finally:
+                latency = time.monotonic() - start
+                stats["processed"] += 1
+                stats["total_latency"] += latency
+                stats["max_latency"] = max(stats["max_latency"], latency)
+                stage.queue.task_done()
+
+    def report(self) -> list[dict]:
+        return [
+            {
+                "stage": stage.name,
+                "depth": stage.queue.qsize(),
+                **stage.stats,
+                "avg_latency": stage.stats["total_latency"] / stage.stats["processed"] if stage.stats["processed"] else 0.0,
+            }
+            for stage in self.stages
+        ]
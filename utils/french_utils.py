@@ -1,114 +1,208 @@
+import asyncio
+import datetime
 import random
-from googleapiclient.discovery import build
 
-from google_auth_creds import get_googleapi_credentials
-from queries.french_queries import add_video, get_random_playlist, get_video_by_id
-from utils import youtube_utils
+from config import FRENCH_SYNC_MAX_AGE
+from queries.french_queries import (PLAYABLE, claim_shuffle_position, get_playable_video_ids, get_playlist_by_id,
+                                    get_playlists, get_random_playlist, get_shuffled_video_id, get_video_by_id,
+                                    get_videos_without_duration, mark_legacy_videos_suggested, mark_suggested,
+                                    mirror_playlist_items, replace_exhausted_shuffle, unmirror_playlist_items,
+                                    update_playlist_by_id, update_videos)
 from utils.logging_utils import setup_logger, unexpected_error_handler
+from utils.quota_utils import QuotaExceededError, quota
+from utils.youtube_api import youtube_api
 
 logger = setup_logger(__name__)
 
-async def request_videos_by_playlistId(playlistId: str, part: str = "contentDetails", max_results: int = 50, page_token: str = '') -> dict[str, str]:
-    try:
-        with build("youtube", "v3", credentials=get_googleapi_credentials()) as youtube:
-            request = youtube.playlistItems().list(
-                part=part,
-                playlistId=playlistId,
-                maxResults=max_results,
-                pageToken=page_token
-            )
-
-            response = request.execute()
-            return response
-    except Exception as e:
-        unexpected_error_handler(logger, e, playlistId=playlistId)
-        return None
-    
-async def random_video(playlists: list = None) -> dict[str, str]:
+async def sync_playlist(playlist: dict) -> int:
+    """
+    Mirror the items of a playlist into french.videos and return how many changed.
+    The sync is incremental: a playlist whose ETag is unchanged is skipped unless
+    its last full walk is older than FRENCH_SYNC_MAX_AGE, and pages whose ETag is
+    unchanged are neither downloaded nor rewritten. Items that left the playlist
+    lose their position; durations are fetched for new playable videos only.
+    """
+    playlist_id = playlist["_id"]
+    state = playlist.get("sync") or {}
+    now = int(datetime.datetime.now().timestamp())
+    stale = now - state.get("syncedAt", 0) > FRENCH_SYNC_MAX_AGE
+    response = await youtube_api.playlists(
+        part="contentDetails", id=playlist_id, etag=None if stale else state.get("etag"))
+    if response is None:
+        return 0
+    if not response["items"]:
+        logger.critical(f"Playlist {playlist_id} not found. Response: {response}")
+        return 0
+    playlist_etag = response["etag"]
+
+    old_pages = state.get("pages", [])
+    pages, changed = [], []
+    page_token = None
+    while True:
+        index = len(pages)
+        old_page = old_pages[index] if index < len(old_pages) and old_pages[index]["pageToken"] == page_token else None
+        page = await youtube_api.playlist_items(
+            part=["snippet", "status"],
+            playlistId=playlist_id,
+            maxResults=50,
+            pageToken=page_token,
+            etag=old_page["etag"] if old_page else None
+        )
+        if page is None:
+            pages.append(old_page)
+        else:
+            items = [{
+                "_id": item["snippet"]["resourceId"]["videoId"],
+                "position": item["snippet"]["position"],
+                "privacy": item.get("status", {}).get("privacyStatus", "unavailable"),
+                "title": item["snippet"]["title"],
+            } for item in page["items"]]
+            changed.extend(items)
+            pages.append({
+                "pageToken": page_token,
+                "nextPageToken": page.get("nextPageToken"),
+                "etag": page["etag"],
+                "videoIds": [item["_id"] for item in items],
+            })
+        page_token = pages[-1]["nextPageToken"]
+        if not page_token:
+            break
+
+    await mirror_playlist_items.aio(playlist_id, changed)
+    current = {video_id for page in pages for video_id in page["videoIds"]}
+    removed = [video_id for page in old_pages for video_id in page["videoIds"] if video_id not in current]
+    await unmirror_playlist_items.aio(playlist_id, removed)
+
+    missing = await get_videos_without_duration.aio([item["_id"] for item in changed])
+    for i in range(0, len(missing), 50):
+        batch = missing[i:i + 50]
+        response = await youtube_api.videos(part="contentDetails", id=batch, maxResults=50)
+        updates = {video_id: {"privacy": "unavailable"} for video_id in batch}
+        for video in response["items"]:
+            updates[video["id"]] = {"duration": video["contentDetails"]["duration"]}
+        await update_videos.aio(updates)
+
+    await update_playlist_by_id.aio(playlist_id, {
+        "sync": {"etag": playlist_etag, "pages": pages, "syncedAt": now}
+    })
+    logger.info(f"Synced playlist {playlist_id}: {len(changed)} items changed, {len(removed)} removed")
+    return len(changed) + len(removed)
+
+
+async def sync_playlists() -> int:
+    """Sync every playlist in turn, as a background job"""
+    await mark_legacy_videos_suggested.aio()
+    changed = 0
+    with quota.feature("french_sync"):
+        for playlist in await get_playlists.aio(limit=0):
+            try:
+                changed += await sync_playlist(playlist)
+            except QuotaExceededError:
+                raise
+            except Exception as e:
+                unexpected_error_handler(logger, e, playlist_id=playlist["_id"])
+    return changed
+
+
+_sync_tasks: set[asyncio.Task] = set()
+
+
+def schedule_sync(playlist: dict):
+    """Sync a newly added playlist in the background"""
+    async def sync():
+        try:
+            with quota.feature("french_sync"):
+                await sync_playlist(playlist)
+        except Exception as e:
+            unexpected_error_handler(logger, e, playlist_id=playlist["_id"])
+
+    task = asyncio.create_task(sync())
+    _sync_tasks.add(task)
+    task.add_done_callback(_sync_tasks.discard)
+
+
+async def reshuffle(playlist_id: str) -> None:
+    """
+    Start a new permutation of the playlist's videos that were never suggested.
+    Once all of them were, a new round shuffles every playable video again.
+    A playlist that was never synced is synced first.
+    """
+    order = await get_playable_video_ids.aio(playlist_id)
+    if not order:
+        playlist = await get_playlist_by_id.aio(playlist_id)
+        if "sync" not in playlist:
+            await sync_playlist(playlist)
+            order = await get_playable_video_ids.aio(playlist_id)
+    if not order:
+        order = await get_playable_video_ids.aio(playlist_id, unsuggested=False)
+    random.shuffle(order)
+    if await replace_exhausted_shuffle.aio(playlist_id, order):
+        logger.info(f"Reshuffled {len(order)} videos of {playlist_id}")
+
+
+async def next_shuffled_video(playlist_id: str) -> dict[str, str]:
+    """
+    Return the next video of the playlist's persisted permutation, reshuffling it
+    once exhausted. Claiming a position is one atomic update, so concurrent picks
+    never get the same video. Videos that left the playlist, became unplayable or
+    were suggested from another playlist since the shuffle are skipped.
+    Videos synced after the shuffle join the next permutation.
+    """
+    reshuffled = False
+    while True:
+        shuffle = await claim_shuffle_position.aio(playlist_id)
+        if shuffle is None:
+            if reshuffled:
+                return None
+            await reshuffle(playlist_id)
+            reshuffled = True
+            continue
+
+        video_id = await get_shuffled_video_id.aio(playlist_id, shuffle["cursor"])
+        video = await get_video_by_id.aio(video_id)
+        if (video and playlist_id in video.get("positions", {}) and video.get("privacy") in PLAYABLE
+                and "duration" in video and video.get("suggestedAt", -1) < shuffle["shuffledAt"]):
+            return video
+
+
+async def random_video(playlists: list[str] = None) -> dict[str, str]:
+    """
+    Pick the next unsuggested video from one of the `playlists` ids, or from a
+    random playlist, and mark it suggested. Picks walk a shuffled order stored
+    per playlist, so each costs a few MongoDB reads and no API call.
+    """
+    playlist_id = None
     try:
-        video = None
-        while not video or ("private" in video and video["private"]):
-            if not playlists:
-                random_playlist = get_random_playlist()
-            else:
-                random_playlist = random.choice(playlists)
-            video_id = await random_videoId_from_playlistId(playlistId=random_playlist["_id"])
-            
-            # Check if video is already in the database
-            video = get_video_by_id(video_id)
-            if video:
-                logger.info(f"Video already in database: {video}")
-                continue
-
-
-            response = youtube_utils.request_video_by_id(video_id)
-            
-            # If video is private
-            if not response:
-                add_video(
-                    {
-                        "_id": video_id,
-                        "playlist": random_playlist["_id"],
-                        "private": True
-                    })
-                logger.warning(f"Private video: {video_id}")
-            else:
-                video = {
-                    "_id": video_id,
-                    "title": response["snippet"]["title"],
-                    "duration": response["contentDetails"]["duration"],
-                    "playlist": random_playlist["_id"],
-                }
-                add_video(video)
-                logger.info(f"Added video: {video}")
+        if playlists:
+            playlist_id = random.choice(playlists)
+        else:
+            playlist_id = (await get_random_playlist.aio())["_id"]
+
+        video = await next_shuffled_video(playlist_id)
+        if video is None:
+            logger.warning(f"No video to suggest in {playlist_id}")
+            return None
+
+        await mark_suggested.aio(video["_id"])
+        video = {"_id": video["_id"], "title": video["title"], "duration": video["duration"], "playlist": playlist_id}
+        logger.info(f"Suggested video: {video}")
         return video
+    except QuotaExceededError:
+        raise
     except Exception as e:
-        unexpected_error_handler(logger, e, video=video, random_playlist=random_playlist["title"], video_id=video_id, response=response)
+        unexpected_error_handler(logger, e, playlist_id=playlist_id)
         return None
 
-async def random_videoId_from_playlistId(playlistId: str) -> str:
-    try:
-        # Get the number of items in the playlist
-        with build("youtube", "v3", credentials=get_googleapi_credentials()) as youtube:
-            request = youtube.playlists().list(
-                part="contentDetails",
-                id=playlistId,
-                maxResults=1
-            )
-
-            response = request.execute()
-            if not response["items"]:
-                logger.critical(f"Playlist {playlistId} not found. Response: {response}")
-            item_count = response["items"][0]["contentDetails"]["itemCount"]
-
-        random_index: int = random.randint(0, item_count - 1)
-
-        page_token: str = ''
-        for _ in range((random_index // 50) + 1):
-            response = await request_videos_by_playlistId(playlistId, page_token=page_token)
-            if "nextPageToken" not in response:
-                break
-            page_token = response["nextPageToken"]
-        videoId = response["items"][random_index %
-                                    50]["contentDetails"]["videoId"]
-        return videoId
-    except Exception as e:
-        unexpected_error_handler(
-            logger, e, playlistId=playlistId, response=response)
-        return None
-    
 def playlistId_to_url(playlist_id: str) -> str:
     return f"https://www.youtube.com/playlist?list={playlist_id}"
 
-def request_playlistTitle_by_id(playlist_id: str) -> str:
+async def request_playlistTitle_by_id(playlist_id: str) -> str:
     title = None
     try:
-        with build("youtube", "v3", credentials=get_googleapi_credentials()) as youtube:
-            request = youtube.playlists().list(
-                part="snippet",
-                id=playlist_id
-            )
-            response = request.execute()
+        response = await youtube_api.playlists(
+            part="snippet",
+            id=playlist_id
+        )
         title = response["items"][0]["snippet"]["title"]
     except KeyError:
         logger.info(response)
@@ -0,0 +1,34 @@
+import aiohttp
+from config import HTTP_CONNECTIONS, HTTP_CONNECTIONS_PER_HOST, HTTP_DNS_CACHE_TTL
+
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=30)
+
+_session: aiohttp.ClientSession = None
+
+
+async def open_session() -> aiohttp.ClientSession:
+    """
+    Create the bot-wide aiohttp session, or return it if it is already open.
+    Connections are kept alive and pooled, at most HTTP_CONNECTIONS_PER_HOST per
+    host, and DNS answers are cached for HTTP_DNS_CACHE_TTL seconds.
+    Must be called on the bot's event loop.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=HTTP_CONNECTIONS,
+                limit_per_host=HTTP_CONNECTIONS_PER_HOST,
+                ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+                keepalive_timeout=60,
+            ),
+            timeout=HTTP_TIMEOUT,
+        )
+    return _session
+
+
+async def close_session() -> None:
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
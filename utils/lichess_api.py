@@ -0,0 +1,156 @@
+import asyncio
+import collections
+import email.utils
+import hashlib
+from datetime import datetime, timezone
+
+from config import LICHESS_CACHE_SIZE, LICHESS_RETRY_AFTER, PGN_IMPORT_CONCURRENCY
+from queries.chess_queries import add_import, get_import_url
+from utils.http_utils import open_session
+from utils.logging_utils import setup_logger, unexpected_error_handler
+
+logger = setup_logger(__name__)
+
+
+def pgn_hash(pgn: str) -> str:
+    return hashlib.sha256(pgn.encode()).hexdigest()
+
+
+def retry_after_seconds(value: str, default: float) -> float:
+    """Parse a Retry-After header, given either in seconds or as an HTTP date"""
+    if not value:
+        return default
+    if value.isdigit():
+        return float(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+class LichessApi:
+    """
+    Import games to Lichess through a queue served by `concurrency` workers.
+    A 429 pauses every worker for the response's Retry-After (LICHESS_RETRY_AFTER
+    seconds if absent) and the throttled game is retried, so pending imports wait
+    in the queue instead of failing. A game is given up after `retries` retries,
+    whether throttled or answered 5xx.
+    Imported URLs are cached by the hash of the normalised PGN, in memory and in
+    chess.imports, so a game posted again is answered without calling Lichess.
+    """
+    IMPORT_URL = "https://lichess.org/api/import"
+
+    def __init__(self, concurrency: int = PGN_IMPORT_CONCURRENCY, cache_size: int = LICHESS_CACHE_SIZE,
+                 retry_after: float = LICHESS_RETRY_AFTER, retries: int = 3):
+        self.concurrency = concurrency
+        self.cache_size = cache_size
+        self.retry_after = retry_after
+        self.retries = retries
+        self._queue: asyncio.Queue = None
+        self._workers: list[asyncio.Task] = []
+        self._resume_at = 0.0
+        self._cache: collections.OrderedDict[str, str] = collections.OrderedDict()
+        self._pending: dict[str, asyncio.Future] = {}
+        self.stats = {"hits": 0, "misses": 0, "imports": 0, "failures": 0, "throttled": 0}
+
+    async def start(self) -> None:
+        if not self._workers:
+            self._queue = asyncio.Queue()
+            self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def close(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def import_game(self, pgn: str) -> str:
+        """Return the analysis URL of a normalised game, or None if it could not be imported"""
+        key = pgn_hash(pgn)
+        url = self._cache.get(key)
+        if url is None:
+            url = await get_import_url.aio(key)
+        if url is not None:
+            self.stats["hits"] += 1
+            self._remember(key, url)
+            return url
+
+        if key in self._pending:
+            self.stats["hits"] += 1
+            return await asyncio.shield(self._pending[key])
+
+        self.stats["misses"] += 1
+        await self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        self._queue.put_nowait((key, pgn, future))
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self._pending.pop(key, None)
+
+    def _remember(self, key: str, url: str):
+        self._cache[key] = url
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            key, pgn, future = await self._queue.get()
+            url = None
+            try:
+                attempt = 0
+                while True:
+                    delay = self._resume_at - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    throttled = False
+                    session = await open_session()
+                    async with session.post(self.IMPORT_URL, headers={"Accept": "application/json"}, data={"pgn": pgn}) as resp:
+                        if resp.status == 429:
+                            wait = retry_after_seconds(resp.headers.get("Retry-After"), self.retry_after)
+                            self._resume_at = max(self._resume_at, loop.time() + wait)
+                            self.stats["throttled"] += 1
+                            logger.warning(f"Lichess import throttled, pausing imports for {wait}s")
+                            throttled = True
+                        else:
+                            try:
+                                resp_data = await resp.json(content_type=None)
+                            except ValueError:
+                                resp_data = None
+                            if resp.status == 200 and resp_data:
+                                url = resp_data["url"]
+                                break
+                            logger.critical(f"Lichess import returned {resp_data}, {resp.status}, {resp.reason}")
+                            if resp.status < 500:
+                                break
+                    if attempt >= self.retries:
+                        break
+                    attempt += 1
+                    if not throttled:
+                        await asyncio.sleep(0.5 * 2 ** attempt)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                unexpected_error_handler(logger, e, pgn=pgn)
+
+            if url is None:
+                self.stats["failures"] += 1
+            else:
+                self.stats["imports"] += 1
+                self._remember(key, url)
+                await add_import.aio(key, url)
+            if not future.done():
+                future.set_result(url)
+
+    def report(self) -> dict:
+        return {"queued": self._queue.qsize() if self._queue else 0, "cached": len(self._cache), **self.stats}
+
+
+lichess_api = LichessApi()
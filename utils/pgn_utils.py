@@ -0,0 +1,154 @@
+import codecs
+import re
+from typing import AsyncIterator, Union
+
+TAG_PAIR = re.compile(r'^\[([A-Za-z0-9_]+)\s+"((?:[^"\\]|\\.)*)"\]$')
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+MAX_GAME_SIZE = 64 * 1024  # Generous for one game, keeps pasted junk away from Lichess
+
+
+class PgnError(ValueError):
+    pass
+
+
+class PgnSplitter:
+    """
+    Split a PGN stream into games as it arrives.
+    feed() takes text chunks of any size and returns the games they complete;
+    close() returns the last one. Only the current game is kept in memory.
+    A game is its tag pairs followed by movetext, so a tag pair line that comes
+    after movetext, outside a {comment}, starts the next game. Games over MAX_GAME_SIZE are not buffered;
+    they are returned as a PgnError instance so the caller can report them.
+    """
+
+    def __init__(self):
+        self._partial = ""
+        self._lines: list[str] = []
+        self._size = 0
+        self._in_movetext = False
+        self._comment_depth = 0
+        self._oversized = False
+
+    def feed(self, chunk: str) -> list[Union[str, PgnError]]:
+        games = []
+        lines = (self._partial + chunk).split("\n")
+        self._partial = lines.pop()
+        if len(self._partial) > MAX_GAME_SIZE:
+            self._partial = ""
+            self._oversized = True
+        for line in lines:
+            game = self._add_line(line)
+            if game is not None:
+                games.append(game)
+        return games
+
+    def close(self) -> list[Union[str, PgnError]]:
+        games = self.feed("\n")
+        game = self._finish()
+        if game is not None:
+            games.append(game)
+        return games
+
+    def _add_line(self, line: str):
+        line = line.rstrip("\r").strip()
+        game = None
+        if self._in_movetext and self._comment_depth == 0 and TAG_PAIR.match(line):
+            game = self._finish()
+        elif line and not line.startswith("%") and (self._in_movetext or not line.startswith("[")):
+            self._in_movetext = True
+            # Wrapped comments can start a line with [%clk ...] or [%eval ...]
+            self._comment_depth = max(0, self._comment_depth + line.count("{") - line.count("}"))
+
+        if self._size + len(line) > MAX_GAME_SIZE:
+            # Drop the rest of an oversized game but remember it, so it is reported
+            self._oversized = True
+        elif line or self._lines:
+            self._lines.append(line)
+            self._size += len(line) + 1
+        return game
+
+    def _finish(self):
+        text = "\n".join(self._lines).strip()
+        oversized = self._oversized
+        self._lines, self._size, self._in_movetext, self._oversized = [], 0, False, False
+        self._comment_depth = 0
+        if oversized:
+            return PgnError("Game is too large")
+        return text or None
+
+
+def looks_like_pgn(text: str) -> bool:
+    return any(TAG_PAIR.match(line.strip()) for line in text.splitlines())
+
+
+def split_games(text: str) -> list[Union[str, PgnError]]:
+    splitter = PgnSplitter()
+    return splitter.feed(text) + splitter.close()
+
+
+async def split_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[Union[str, PgnError]]:
+    """Split an async iterator of byte chunks (e.g. an HTTP body) into games"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    splitter = PgnSplitter()
+    async for chunk in chunks:
+        for game in splitter.feed(decoder.decode(chunk)):
+            yield game
+    for game in splitter.feed(decoder.decode(b"", final=True)) + splitter.close():
+        yield game
+
+
+def normalise_game(text: str) -> str:
+    """
+    Check that a game looks like PGN and return it in a canonical layout:
+    one tag pair per line, a blank line, then the movetext on one line with
+    single spaces. Raise PgnError with the reason otherwise.
+    Normalised games compare equal when only their formatting differs.
+    """
+    tags, moves = [], []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("%"):
+            continue
+        if line.startswith("[") and not moves:
+            if not TAG_PAIR.match(line):
+                raise PgnError(f"Malformed tag pair: {line[:50]}")
+            tags.append(line)
+        else:
+            moves.append(line)
+
+    if not tags:
+        raise PgnError("No tag pairs")
+    movetext = " ".join(" ".join(moves).split())
+    if not movetext:
+        raise PgnError("No moves")
+    if movetext.count("{") != movetext.count("}") or movetext.count("(") != movetext.count(")"):
+        raise PgnError("Unbalanced comment or variation")
+    if not movetext.endswith(RESULTS):
+        raise PgnError("Missing game result")
+    return "\n".join(tags) + "\n\n" + movetext + "\n"
+
+
+def game_title(pgn: str) -> str:
+    tags = dict(match.groups() for match in map(TAG_PAIR.match, pgn.splitlines()) if match)
+    return f"{tags.get('White', '?')} vs {tags.get('Black', '?')}"
+
+
+if __name__ == "__main__":
+    content = """[Event "Live Chess"]
+[Site "Chess.com"]
+[White "Alice"]
+[Black "Bob"]
+[Result "1-0"]
+
+1. e4 e5 2. Qh5 Nc6 3. Bc4 Nf6 4. Qxf7# 1-0
+
+[Event "Live Chess"]
+[Site "Chess.com"]
+[White "Bob"]
+[Black "Alice"]
+[Result "*"]
+
+1. d4 {A comment} d5 *
+"""
+    for game in split_games(content):
+        print(game_title(normalise_game(game)), repr(normalise_game(game)))
@@ -0,0 +1,213 @@
+import asyncio
+import collections
+import itertools
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+# utils.logging_utils imports config, which imports this module
+logger = logging.getLogger(__name__)
+
+
+class DurableQueue:
+    """
+    Append-only store of queued items in SQLite (WAL mode).
+    append() and ack() only hand the write to a writer thread, so callers never
+    wait on the disk: ids are allocated in memory, and the writer applies the
+    waiting writes and commits them every `flush_interval` seconds, or as soon as
+    `batch_size` writes are waiting, so one fsync covers many items.
+    Items that were appended but never acknowledged are returned by pending().
+    """
+
+    def __init__(self, path: str, batch_size: int = 100, flush_interval: float = 0.2):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()  # Serialises use of the connection
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level="DEFERRED")
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, created REAL NOT NULL)")
+        self._connection.commit()
+        last_id, self._count = self._connection.execute("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM items").fetchone()
+        self._ids = itertools.count(last_id + 1)
+        self._count_lock = threading.Lock()
+        self._writes: queue.SimpleQueue = queue.SimpleQueue()
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._writer = threading.Thread(target=self._write_periodically, name="durable-queue-writer", daemon=True)
+        self._writer.start()
+
+    def append(self, item) -> int:
+        item_id = next(self._ids)
+        self._submit("INSERT INTO items (id, payload, created) VALUES (?, ?, ?)", (item_id, json.dumps(item), time.time()), 1)
+        return item_id
+
+    def ack(self, item_id: int) -> None:
+        self._submit("DELETE FROM items WHERE id = ?", (item_id,), -1)
+
+    def pending(self) -> list[tuple[int, object]]:
+        self.flush()
+        with self._lock:
+            rows = self._connection.execute("SELECT id, payload FROM items ORDER BY id").fetchall()
+        return [(item_id, json.loads(payload)) for item_id, payload in rows]
+
+    def count(self) -> int:
+        with self._count_lock:
+            return self._count
+
+    def flush(self) -> None:
+        """Wait until the writes submitted so far are committed"""
+        if not self._writer.is_alive():
+            return
+        committed = threading.Event()
+        self._writes.put(committed)
+        self._wake.set()
+        committed.wait()
+
+    def close(self) -> None:
+        self._closed.set()
+        self._wake.set()
+        self._writer.join()
+        with self._lock:
+            self._connection.close()
+
+    def _submit(self, sql: str, params: tuple, delta: int):
+        with self._count_lock:
+            self._count += delta
+        self._writes.put((sql, params))
+        if self._writes.qsize() >= self.batch_size:
+            self._wake.set()
+
+    def _write_periodically(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self._write_waiting()
+            if self._closed.is_set() and self._writes.empty():
+                return
+
+    def _write_waiting(self):
+        committed = []
+        with self._lock:
+            while True:
+                try:
+                    write = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(write, threading.Event):
+                    committed.append(write)
+                else:
+                    try:
+                        self._connection.execute(*write)
+                    except sqlite3.Error:
+                        # Keep the writer alive; the other writes of the batch still count
+                        logger.exception(f"Durable queue write failed: {write[0]}")
+            self._connection.commit()
+        for event in committed:
+            event.set()
+
+
+class LoopQueue:
+    """
+    Hand items from any thread to a consumer on an asyncio event loop.
+    put() wakes the consumer as soon as an item is enqueued, so there is no polling,
+    and get_batch() returns everything available at each wakeup.
+    Items put before the consumer binds the loop are kept and delivered once it does.
+    With a DurableQueue, items are persisted on put() and deleted by ack(); those
+    left unacknowledged by a previous run are replayed when the consumer binds.
+    """
+
+    def __init__(self, durable: DurableQueue = None):
+        self.durable = durable
+        self._loop: asyncio.AbstractEventLoop = None
+        self._queue: asyncio.Queue = None
+        self._backlog = collections.deque()
+        self._lock = threading.Lock()
+        self.stats = {
+            "enqueued": 0,
+            "dequeued": 0,
+            "wakeups": 0,
+            "total_wait": 0.0,
+            "max_wait": 0.0,
+            "replayed": 0,
+        }
+
+    def bind(self, loop: asyncio.AbstractEventLoop = None) -> None:
+        """Attach the queue to the consumer's loop. Must be called on that loop."""
+        with self._lock:
+            self._loop = loop or asyncio.get_running_loop()
+            self._queue = asyncio.Queue()
+            if self.durable:
+                # The backlog is already persisted, together with any previous run's leftovers
+                self._backlog.clear()
+                now = time.monotonic()
+                for queue_id, item in self.durable.pending():
+                    self._queue.put_nowait((now, {**item, "queue_id": queue_id}))
+                    self.stats["replayed"] += 1
+            while self._backlog:
+                self._queue.put_nowait(self._backlog.popleft())
+
+    def put(self, item) -> None:
+        if self.durable:
+            item = {**item, "queue_id": self.durable.append(item)}
+        entry = (time.monotonic(), item)
+        with self._lock:
+            self.stats["enqueued"] += 1
+            if self._loop is None:
+                self._backlog.append(entry)
+                return
+            loop = self._loop
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is loop:
+            self._queue.put_nowait(entry)
+        else:
+            loop.call_soon_threadsafe(self._queue.put_nowait, entry)
+
+    async def get_batch(self) -> list:
+        """Wait for at least one item and return every item currently queued"""
+        if self._queue is None:
+            self.bind()
+        entries = [await self._queue.get()]
+        while not self._queue.empty():
+            entries.append(self._queue.get_nowait())
+
+        now = time.monotonic()
+        self.stats["wakeups"] += 1
+        self.stats["dequeued"] += len(entries)
+        for enqueued_at, _ in entries:
+            wait = now - enqueued_at
+            self.stats["total_wait"] += wait
+            self.stats["max_wait"] = max(self.stats["max_wait"], wait)
+        return [item for _, item in entries]
+
+    def ack(self, item) -> None:
+        """Mark an item as handled so it is not replayed after a restart"""
+        if self.durable and "queue_id" in item:
+            self.durable.ack(item["queue_id"])
+
+    def close(self) -> None:
+        if self.durable:
+            self.durable.close()
+
+    def qsize(self) -> int:
+        with self._lock:
+            if self._queue is None:
+                return len(self._backlog)
+        return self._queue.qsize()
+
+    def report(self) -> dict:
+        dequeued = self.stats["dequeued"]
+        return {
+            "depth": self.qsize(),
+            **self.stats,
+            "avg_wait": self.stats["total_wait"] / dequeued if dequeued else 0.0,
+            "unacked": self.durable.count() if self.durable else None,
+        }
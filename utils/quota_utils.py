@@ -0,0 +1,137 @@
+import asyncio
+import contextlib
+import contextvars
+import threading
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from config import YOUTUBE_QUOTA, YOUTUBE_QUOTA_BUDGETS, YOUTUBE_QUOTA_FEATURES
+from utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+# Units charged per request, see https://developers.google.com/youtube/v3/determine_quota_cost
+COSTS = {
+    "videos": 1,
+    "channels": 1,
+    "playlists": 1,
+    "playlistItems": 1,
+    "search": 100,
+}
+
+try:
+    # The daily quota resets at midnight Pacific Time
+    RESET_TIMEZONE = ZoneInfo("America/Los_Angeles")
+except ZoneInfoNotFoundError:
+    RESET_TIMEZONE = timezone(timedelta(hours=-8))
+
+current_feature: contextvars.ContextVar[str] = contextvars.ContextVar("quota_feature", default="other")
+
+
+class QuotaExceededError(Exception):
+    def __init__(self, feature: str, reset_at: datetime, reason: str):
+        super().__init__(f"YouTube quota unavailable for {feature} until {reset_at.isoformat(timespec='minutes')}: {reason}")
+        self.feature = feature
+        self.reset_at = reset_at
+        self.reason = reason
+
+
+def next_reset(now: datetime) -> datetime:
+    local = now.astimezone(RESET_TIMEZONE)
+    midnight = datetime.combine(local.date() + timedelta(days=1), datetime.min.time(), RESET_TIMEZONE)
+    return midnight.astimezone(timezone.utc)
+
+
+class QuotaManager:
+    """
+    Account for YouTube Data API units spent by each feature of the bot.
+    Every feature has a priority, and every priority may spend at most its share
+    of the daily quota (YOUTUBE_QUOTA_BUDGETS), so background jobs run out first.
+    Once the API answers quotaExceeded, the circuit opens and every request fails
+    fast with QuotaExceededError until the next reset.
+    Usage is kept in memory and restarts from zero with the process.
+    """
+
+    def __init__(self, daily_quota: int = YOUTUBE_QUOTA, budgets: dict[str, float] = YOUTUBE_QUOTA_BUDGETS,
+                 features: dict[str, str] = YOUTUBE_QUOTA_FEATURES):
+        self.daily_quota = daily_quota
+        self.budgets = budgets
+        self.features = features
+        self._lock = threading.Lock()
+        self.reset_at = next_reset(datetime.now(timezone.utc))
+        self.used = 0
+        self.usage: dict[str, int] = {}
+        self.rejected: dict[str, int] = {}
+        self.circuit_open = False
+
+    @contextlib.contextmanager
+    def feature(self, name: str):
+        """Charge the requests made inside the block, and tasks started from it, to `name`"""
+        token = current_feature.set(name)
+        try:
+            yield
+        finally:
+            current_feature.reset(token)
+
+    def priority(self, feature: str) -> str:
+        return self.features.get(feature, "interactive")
+
+    def _roll(self, now: datetime):
+        if now >= self.reset_at:
+            logger.info(f"YouTube quota reset, {self.used} units were used")
+            self.reset_at = next_reset(now)
+            self.used = 0
+            self.usage.clear()
+            self.rejected.clear()
+            self.circuit_open = False
+
+    def reserve(self, endpoint: str) -> None:
+        """Charge one request to the current feature, or raise QuotaExceededError"""
+        feature = current_feature.get()
+        cost = COSTS.get(endpoint, 1)
+        with self._lock:
+            self._roll(datetime.now(timezone.utc))
+            if self.circuit_open:
+                reason = "quota exceeded"
+            elif self.used + cost > self.daily_quota * self.budgets[self.priority(feature)]:
+                reason = f"{self.priority(feature)} budget spent"
+            else:
+                self.used += cost
+                self.usage[feature] = self.usage.get(feature, 0) + cost
+                return
+            self.rejected[feature] = self.rejected.get(feature, 0) + 1
+            reset_at = self.reset_at
+        raise QuotaExceededError(feature, reset_at, reason)
+
+    def trip(self) -> None:
+        """Open the circuit until the next reset after the API reported quotaExceeded"""
+        with self._lock:
+            if not self.circuit_open:
+                logger.critical(
+                    f"YouTube quota exceeded after {self.used} counted units, pausing requests until {self.reset_at}")
+            self.circuit_open = True
+            self.used = max(self.used, self.daily_quota)
+
+    def available(self, feature: str) -> bool:
+        """Whether a 1-unit request of the feature would be allowed now"""
+        with self._lock:
+            self._roll(datetime.now(timezone.utc))
+            return not self.circuit_open and self.used < self.daily_quota * self.budgets[self.priority(feature)]
+
+    async def wait_for_reset(self) -> None:
+        await asyncio.sleep(max(0.0, (self.reset_at - datetime.now(timezone.utc)).total_seconds()))
+
+    def report(self) -> dict:
+        with self._lock:
+            self._roll(datetime.now(timezone.utc))
+            return {
+                "used": self.used,
+                "quota": self.daily_quota,
+                "circuit_open": self.circuit_open,
+                "reset_at": self.reset_at,
+                "usage": dict(self.usage),
+                "rejected": dict(self.rejected),
+            }
+
+
+quota = QuotaManager()
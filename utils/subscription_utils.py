@@ -0,0 +1,176 @@
+import asyncio
+import time
+import zlib
+from urllib.parse import parse_qs, urlparse
+import aiohttp
+from config import CALLBACK_URL, SUBSCRIPTION_CONCURRENCY, SUBSCRIPTION_RENEW_MARGIN, SUBSCRIPTION_RETRIES, SUBSCRIPTION_VERIFY_TIMEOUT, WEBHOOK_SECRET_PER_CHANNEL
+from queries.youtube_queries import get_channels, get_subscriptions, update_subscription
+from utils.http_utils import open_session
+from utils.logging_utils import setup_logger, unexpected_error_handler
+from webhook.signature import hub_secret, signatures_enabled
+
+logger = setup_logger(__name__)
+
+HUB_URL = "https://pubsubhubbub.appspot.com/subscribe"
+TOPIC_URL = "https://www.youtube.com/xml/feeds/videos.xml"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def topic_url(channel_id: str) -> str:
+    return f"{TOPIC_URL}?channel_id={channel_id}"
+
+
+def topic_channel_id(topic: str) -> str:
+    return parse_qs(urlparse(topic or "").query).get("channel_id", [None])[0]
+
+
+def callback_url(channel_id: str) -> str:
+    """Per-channel secrets need the channel id back on every push"""
+    if WEBHOOK_SECRET_PER_CHANNEL:
+        return f"{CALLBACK_URL}/webhook/youtube?channel_id={channel_id}"
+    return f"{CALLBACK_URL}/webhook/youtube"
+
+
+def verification_record(args) -> tuple[str, dict]:
+    """
+    Turn the query of a hub verification GET into (channel id, fields to store).
+    The channel id is None when the topic is not a channel feed.
+    """
+    now = int(time.time())
+    mode = args.get("hub.mode")
+    channel_id = topic_channel_id(args.get("hub.topic"))
+    if mode == "subscribe":
+        lease_seconds = int(args.get("hub.lease_seconds") or 0)
+        fields = {
+            "mode": mode,
+            "verified": True,
+            "verifiedAt": now,
+            "leaseSeconds": lease_seconds,
+            "expiresAt": now + lease_seconds if lease_seconds else None,
+        }
+    elif mode == "denied":
+        fields = {"mode": mode, "verified": False, "deniedAt": now, "reason": args.get("hub.reason")}
+    else:
+        fields = {"mode": mode, "verified": True, "verifiedAt": now, "expiresAt": None}
+    return channel_id, fields
+
+
+def record_verification(args) -> None:
+    """Store the outcome of a verification GET. Called from the Flask thread."""
+    try:
+        channel_id, fields = verification_record(args)
+        if channel_id:
+            update_subscription(channel_id, fields)
+    except Exception as e:
+        unexpected_error_handler(logger, e, args=dict(args))
+
+
+async def arecord_verification(args) -> None:
+    """Store the outcome of a verification GET. Called on the event loop."""
+    try:
+        channel_id, fields = verification_record(args)
+        if channel_id:
+            await update_subscription.aio(channel_id, fields)
+    except Exception as e:
+        unexpected_error_handler(logger, e, args=dict(args))
+
+
+class SubscriptionManager:
+    """
+    Keep the hub subscriptions of all channels alive without gaps.
+    Leases are learnt from the hub's verification requests. A subscription is
+    renewed by subscribing again, never by unsubscribing first, once it is
+    within SUBSCRIPTION_RENEW_MARGIN of expiring. Each channel renews at a fixed
+    point of the first half of that margin, so renewals spread over time instead
+    of all landing together and at least half the margin is left for retries. Subscriptions with no known lease, or whose last
+    request was not verified within SUBSCRIPTION_VERIFY_TIMEOUT, are renewed too.
+    """
+
+    def __init__(self, concurrency: int = SUBSCRIPTION_CONCURRENCY, retries: int = SUBSCRIPTION_RETRIES,
+                 renew_margin: int = SUBSCRIPTION_RENEW_MARGIN, verify_timeout: int = SUBSCRIPTION_VERIFY_TIMEOUT):
+        self.concurrency = concurrency
+        self.retries = retries
+        self.renew_margin = renew_margin
+        self.verify_timeout = verify_timeout
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "renewals": 0}
+
+    async def request(self, channel_id: str, mode: str) -> int:
+        """Ask the hub to (un)subscribe the channel. Return the hub's status code."""
+        session = await open_session()
+        data = {
+            "hub.callback": callback_url(channel_id),
+            "hub.topic": topic_url(channel_id),
+            "hub.verify": "async",
+            "hub.mode": mode,
+        }
+        if signatures_enabled() and mode == "subscribe":
+            data["hub.secret"] = hub_secret(channel_id)
+
+        status = None
+        for attempt in range(self.retries + 1):
+            self.stats["requests"] += 1
+            try:
+                async with session.post(HUB_URL, data=data) as resp:
+                    status = resp.status
+                    if status not in RETRY_STATUSES:
+                        break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Hub {mode} request for {channel_id} failed: {e}")
+            if attempt < self.retries:
+                self.stats["retries"] += 1
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+        if status is None or status >= 300:
+            self.stats["failures"] += 1
+            logger.error(f"Hub {mode} request for {channel_id} returned {status}")
+        else:
+            await update_subscription.aio(channel_id, {"requestedMode": mode, "requestedAt": int(time.time())})
+        return status
+
+    def renew_at(self, channel_id: str, subscription: dict) -> int:
+        """Timestamp after which the channel's subscription should be renewed"""
+        subscription = subscription or {}
+        if subscription.get("mode") == "subscribe" and subscription.get("expiresAt"):
+            # Between renew_margin and renew_margin / 2 before expiry
+            spread = zlib.crc32(channel_id.encode()) % (self.renew_margin // 2 + 1)
+            renew_at = subscription["expiresAt"] - self.renew_margin + spread
+        else:
+            # No known lease: renew as soon as possible
+            renew_at = 0
+        requested_at = subscription.get("requestedAt", 0)
+        if requested_at > subscription.get("verifiedAt", 0):
+            # Give the hub time to verify the last request before sending another
+            renew_at = max(renew_at, requested_at + self.verify_timeout)
+        return renew_at
+
+    async def renew(self, force: bool = False) -> int:
+        """Renew the subscriptions that are due, or all of them. Return how many were renewed."""
+        channels = await get_channels.aio(limit=0)
+        subscriptions = {subscription["_id"]: subscription for subscription in await get_subscriptions.aio()}
+        now = int(time.time())
+        due = [channel["_id"] for channel in channels
+               if force or self.renew_at(channel["_id"], subscriptions.get(channel["_id"])) <= now]
+        if not due:
+            return 0
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def renew_one(channel_id: str) -> bool:
+            async with semaphore:
+                try:
+                    status = await self.request(channel_id, "subscribe")
+                    return status is not None and status < 300
+                except Exception as e:
+                    unexpected_error_handler(logger, e, channel_id=channel_id)
+                    return False
+
+        renewed = sum(await asyncio.gather(*(renew_one(channel_id) for channel_id in due)))
+        self.stats["renewals"] += renewed
+        logger.info(f"Renewed {renewed}/{len(due)} due subscriptions out of {len(channels)}")
+        return renewed
+
+    def report(self) -> dict:
+        return dict(self.stats)
+
+
+subscription_manager = SubscriptionManager()
@@ -0,0 +1,80 @@
+import asyncio
+
+from config import VIDEO_LOOKUP_WINDOW
+from utils.logging_utils import setup_logger
+from utils.quota_utils import current_feature, quota
+from utils.youtube_api import youtube_api
+
+logger = setup_logger(__name__)
+
+VIDEO_PARTS = ["contentDetails", "snippet"]
+MAX_BATCH_SIZE = 50  # videos.list accepts at most 50 ids
+
+
+class VideoLookupBatcher:
+    """
+    Coalesce concurrent videos.list lookups into batched requests.
+    The first lookup opens a window of `window` seconds; every id requested during
+    the window, or until MAX_BATCH_SIZE ids are pending, is fetched in one call.
+    Lookups are batched per quota feature, so each batch is charged to, and
+    limited by the budget of, the feature that requested it. Lookups for an id
+    already pending for the same feature share its result.
+    """
+
+    def __init__(self, window: float = VIDEO_LOOKUP_WINDOW):
+        self.window = window
+        self._pending: dict[str, dict[str, asyncio.Future]] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.stats = {"lookups": 0, "coalesced": 0, "batches": 0, "errors": 0}
+
+    async def get(self, video_id: str) -> dict:
+        """Return the video resource, or None if it does not exist or is private"""
+        self.stats["lookups"] += 1
+        feature = current_feature.get()
+        batch = self._pending.setdefault(feature, {})
+        if video_id in batch:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(batch[video_id])
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch[video_id] = future
+        if len(batch) >= MAX_BATCH_SIZE:
+            self._flush(feature)
+        elif feature not in self._timers:
+            self._timers[feature] = loop.call_later(self.window, self._flush, feature)
+        return await asyncio.shield(future)
+
+    def _flush(self, feature: str):
+        timer = self._timers.pop(feature, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(feature, None)
+        if batch:
+            task = asyncio.create_task(self._execute(feature, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, feature: str, batch: dict[str, asyncio.Future]):
+        self.stats["batches"] += 1
+        try:
+            with quota.feature(feature):
+                response = await youtube_api.videos(
+                    part=VIDEO_PARTS,
+                    id=list(batch),
+                    maxResults=MAX_BATCH_SIZE
+                )
+            items = {item["id"]: item for item in response.get("items", [])}
+            logger.info(
+                f"Fetched {len(items)}/{len(batch)} videos in one request")
+            for video_id, future in batch.items():
+                future.set_result(items.get(video_id))
+        except Exception as e:
+            self.stats["errors"] += 1
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+
+
+video_lookup = VideoLookupBatcher()
@@ -0,0 +1,107 @@
+import asyncio
+import aiohttp
+
+from config import YOUTUBE_API_RETRIES, YOUTUBE_API_TIMEOUT
+from google_auth_creds import get_googleapi_credentials_async
+from utils.http_utils import open_session
+from utils.logging_utils import setup_logger
+from utils.quota_utils import QuotaExceededError, current_feature, quota
+
+logger = setup_logger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+QUOTA_REASONS = {"quotaExceeded", "dailyLimitExceeded"}
+
+
+def _format_param(value) -> str:
+    if isinstance(value, (list, tuple)):
+        return ",".join(value)
+    if isinstance(value, bool):
+        return str(value).lower()
+    return str(value)
+
+
+class YouTubeApiError(Exception):
+    def __init__(self, status: int, reason: str, message: str):
+        super().__init__(f"{status} {reason}: {message}")
+        self.status = status
+        self.reason = reason
+        self.message = message
+
+
+class YouTubeApi:
+    """
+    Minimal asyncio client for the YouTube Data API v3.
+    Requests go through the bot-wide pooled session (http_utils), time out after
+    `timeout` seconds and are retried with exponential backoff on connection
+    errors, 429 and 5xx responses.
+    Every attempt is charged to the quota manager first, which may refuse it.
+    Parameters use the REST names (part, id, playlistId, maxResults, ...);
+    list values are joined with commas. With `etag`, the request is conditional
+    and returns None when the resource has not changed (304).
+    """
+    BASE_URL = "https://www.googleapis.com/youtube/v3"
+
+    def __init__(self, timeout: float = YOUTUBE_API_TIMEOUT, retries: int = YOUTUBE_API_RETRIES):
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+
+    async def request(self, endpoint: str, etag: str = None, **params) -> dict:
+        session = await open_session()
+        params = {key: _format_param(value) for key, value in params.items() if value is not None}
+        url = f"{self.BASE_URL}/{endpoint}"
+
+        for attempt in range(self.retries + 1):
+            quota.reserve(endpoint)
+            credentials = await get_googleapi_credentials_async()
+            headers = {"Accept": "application/json"}
+            credentials.apply(headers)
+            if etag:
+                headers["If-None-Match"] = etag
+            try:
+                async with session.get(url, params=params, headers=headers, timeout=self.timeout) as resp:
+                    if resp.status == 304:
+                        return None
+                    try:
+                        data = await resp.json(content_type=None)
+                    except ValueError:
+                        # Gateways answer errors with HTML; those statuses are still retried below
+                        data = None
+                    if resp.status == 200 and data is not None:
+                        return data
+                    error = data.get("error", {}) if isinstance(data, dict) else {}
+                    reasons = [e.get("reason") for e in error.get("errors", [])]
+                    exception = YouTubeApiError(
+                        resp.status, reasons[0] if reasons else resp.reason, error.get("message", ""))
+                    if exception.reason in QUOTA_REASONS:
+                        quota.trip()
+                        raise QuotaExceededError(current_feature.get(), quota.reset_at, exception.message) from exception
+                    if resp.status not in RETRY_STATUSES and resp.status != 200:
+                        raise exception
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                exception = e
+
+            if attempt < self.retries:
+                delay = 0.5 * 2 ** attempt
+                logger.warning(
+                    f"YouTube {endpoint} failed with {exception}, retrying in {delay}s")
+                await asyncio.sleep(delay)
+        raise exception
+
+    async def videos(self, **params) -> dict:
+        return await self.request("videos", **params)
+
+    async def channels(self, **params) -> dict:
+        return await self.request("channels", **params)
+
+    async def playlists(self, **params) -> dict:
+        return await self.request("playlists", **params)
+
+    async def playlist_items(self, **params) -> dict:
+        return await self.request("playlistItems", **params)
+
+    async def search(self, **params) -> dict:
+        return await self.request("search", **params)
+
+
+youtube_api = YouTubeApi()
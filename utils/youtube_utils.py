@@ -1,76 +1,168 @@
 import asyncio
-import aiohttp
-from bs4 import BeautifulSoup
 import re
 import discord
-from config import BOT_QUEUE, CALLBACK_URL, DEBUG_CHANNEL, VIDEO_AGE_LIMIT
-from queries.youtube_queries import add_channel, add_video, get_channel_by_id, get_channels, get_video_by_id, remove_channel
+from config import BOT_QUEUE, DEBUG_CHANNEL, MAX_NOTIFICATION_SIZE, MISSING_VIDEOS_CONCURRENCY, MISSING_VIDEOS_LOOKBACK_DAYS, MISSING_VIDEOS_MAX_PAGES, MISSING_VIDEOS_OVERLAP_HOURS, PIPELINE_CONCURRENCY, SEEN_VIDEOS_CACHE_SIZE, SEEN_VIDEOS_CACHE_TTL, VIDEO_AGE_LIMIT
+from queries.youtube_queries import add_channel, add_video, get_channel_by_id, get_channels, get_existing_video_ids, get_video_by_id, get_video_titles_by_channelId, mark_video_sent, remove_channel, update_channel_by_id
 
 from utils.logging_utils import setup_logger, unexpected_error_handler
-from google_auth_creds import get_googleapi_credentials
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+from utils.youtube_api import YouTubeApiError, youtube_api
+from utils.quota_utils import QuotaExceededError, quota
+from utils.video_lookup import video_lookup
+from utils.dispatch_utils import RetryLater, StagedPipeline
+from utils.cache_utils import RecentIdCache
+from utils.channel_cache import channel_cache
+from webhook.parsers import DeletedEntry, FeedParseError, parse_feed
+from utils.subscription_utils import subscription_manager
 
 from views.youtube.VideoView import VideoView
 from datetime import datetime, timedelta, timezone
 
 logger = setup_logger(__name__)
 
+seen_videos = RecentIdCache(maxsize=SEEN_VIDEOS_CACHE_SIZE, ttl=SEEN_VIDEOS_CACHE_TTL)
 
-def youtube_parser(content: str) -> str:
-    """Parse the content of a YouTube feed and return the link to the video"""
-    # id, title, channelId, watchTime, duration
-    video = dict()
+
+async def parse_notification(content: bytes) -> list[dict[str, str]]:
+    """Parse the content of a YouTube feed into every notified video"""
     try:
-        soup = BeautifulSoup(content, 'xml')
-        if not soup.entry:
-            logger.critical(f"Received invalid response: {content}")
-            return None
-        entry = soup.entry
-        video = {
-            "_id": entry.videoId.text,
-            "channelId": entry.channelId.text,
-            "title": entry.title.text,
-        }
-
-        response = request_video_by_id(video["_id"])
-        if not response:
-            return None
-        
-        video["duration"] = response["contentDetails"]["duration"]
-
-        published_time = datetime.fromisoformat(
-            response["snippet"]["publishedAt"])
-        published_timedelta = datetime.now(
-            timezone.utc) - published_time
-        if published_timedelta > timedelta(days=VIDEO_AGE_LIMIT):
-            logger.info(f"Video is too old: {video}")
-            return None
-
-        if video["channelId"] == DEBUG_CHANNEL:
-            return video
-
-        existing_video = get_video_by_id(video["_id"])
-        if existing_video:
-            logger.info(f"Video already exists: {video}")
-            return None
-
-        channel = get_channel_by_id(video["channelId"])
-        if "keywords" in channel and channel["keywords"]:
-            if "$SHORT" in channel["keywords"]:
-                if check_short(video["duration"]):
-                    return video
-
-                logger.info(f"Video is too long: {video}")
-                return None
-            if not check_keywords(video["title"], channel["keywords"]):
-                logger.info(f"Video does not match keywords: {video}")
-                return None
+        records = list(parse_feed(content))
+    except FeedParseError as e:
+        logger.critical(f"Received invalid response: {e}, {content[:200]}")
+        return []
+
+    videos = []
+    for record in records:
+        if isinstance(record, DeletedEntry):
+            logger.info(f"Video deleted: {record}")
+            continue
+        # Hub re-pushes a video on every edit and on redelivery
+        if record.channel_id != DEBUG_CHANNEL and not seen_videos.claim(record.video_id):
+            logger.info(f"Video recently processed: {record.video_id}")
+            continue
+        videos.append({
+            "_id": record.video_id,
+            "channelId": record.channel_id,
+            "title": record.title,
+        })
+    return videos
+
+
+def is_sent(stored: dict) -> bool:
+    """Whether a stored video was sent. Videos stored before sentAt existed were all sent."""
+    return stored is not None and stored.get("sentAt", True) is not None
+
+
+async def dedupe_video(video: dict[str, str]) -> list[dict[str, str]]:
+    """Drop videos that were already sent, before spending any quota on them"""
+    if video["channelId"] != DEBUG_CHANNEL and is_sent(await get_video_by_id.aio(video["_id"])):
+        logger.info(f"Video already sent: {video}")
+        return []
+    return [video]
+
+
+async def enrich_video(video: dict[str, str]) -> list[dict[str, str]]:
+    """Add the duration and publish time from videos.list"""
+    try:
+        with quota.feature("webhook"):
+            response = await video_lookup.get(video["_id"])
+    except QuotaExceededError as e:
+        # The claim must be released, not marked done, or the catch-up would skip the video
+        schedule_catch_up()
+        raise RetryLater(f"Deferred {video['_id']} to the catch-up after the quota reset: {e}") from e
+    if not response:
+        # Fresh uploads can be missing from videos.list for a while. The hub was
+        # already answered and will not redeliver, so the pipeline looks again later.
+        raise RetryLater(f"Video not found: {video['_id']}", resubmit=True)
+    video["duration"] = response["contentDetails"]["duration"]
+    video["publishedAt"] = response["snippet"]["publishedAt"]
+    return [video]
+
+
+async def filter_video(video: dict[str, str]) -> list[dict[str, str]]:
+    """Apply the age limit and the channel's keyword filters"""
+    published_time = datetime.fromisoformat(video.pop("publishedAt"))
+    published_timedelta = datetime.now(
+        timezone.utc) - published_time
+    if published_timedelta > timedelta(days=VIDEO_AGE_LIMIT):
+        logger.info(f"Video is too old: {video}")
+        return []
+
+    if video["channelId"] == DEBUG_CHANNEL:
+        return [video]
+
+    channel = await channel_cache.get(video["channelId"])
+    if not channel:
+        logger.info(f"Channel is not subscribed: {video}")
+        return []
+    if "keywords" in channel and channel["keywords"]:
+        if "$SHORT" in channel["keywords"]:
+            if check_short(video["duration"]):
+                return [video]
+
+            logger.info(f"Video is too long: {video}")
+            return []
+        if not check_keywords(video["title"], channel["keywords"]):
+            logger.info(f"Video does not match keywords: {video}")
+            return []
+
+    return [video]
+
+
+async def enqueue_video(video: dict[str, str]) -> list:
+    msg = {
+        'type': 'youtube',
+        'data': video,
+    }
+    BOT_QUEUE.put(msg)
+    logger.info(f"Added {msg} to queue")
+    return [video]
+
+
+_catch_up_task: asyncio.Task = None
+
+
+def schedule_catch_up():
+    """Run find_missing_videos once the quota resets, to queue the videos dropped meanwhile"""
+    global _catch_up_task
+    if _catch_up_task is not None and not _catch_up_task.done():
+        return
+
+    async def catch_up():
+        await quota.wait_for_reset()
+        try:
+            queued = await find_missing_videos()
+            logger.info(f"Queued {queued} videos deferred by the quota")
+        except Exception as e:
+            unexpected_error_handler(logger, e)
+
+    _catch_up_task = asyncio.create_task(catch_up())
+
+
+def _release_video(item):
+    # Raw payloads leave the pipeline at the parse stage and hold no claim
+    if isinstance(item, dict):
+        seen_videos.done(item["_id"])
+
+
+def _retry_video(item):
+    if isinstance(item, dict):
+        seen_videos.forget(item["_id"])
+
+
+# Webhook payloads are staged here and processed after the hub has been answered
+notification_pipeline = StagedPipeline([
+    ("parse", parse_notification, PIPELINE_CONCURRENCY["parse"]),
+    ("dedupe", dedupe_video, PIPELINE_CONCURRENCY["dedupe"]),
+    ("enrich", enrich_video, PIPELINE_CONCURRENCY["enrich"]),
+    ("filter", filter_video, PIPELINE_CONCURRENCY["filter"]),
+    ("enqueue", enqueue_video, PIPELINE_CONCURRENCY["enqueue"]),
+], on_done=_release_video, on_error=_retry_video)
+
+
+def validate_notification(data: bytes) -> bool:
+    """Cheap checks done before acknowledging a webhook POST"""
+    return 0 < len(data) <= MAX_NOTIFICATION_SIZE and data.lstrip().startswith(b"<")
 
-        return video
-    except Exception as e:
-        unexpected_error_handler(logger, e, content=content, response=response)
-        return None
 
 def check_short(duration_str: str) -> bool:
     """Return True if the video is less than 2 minutes long"""
@@ -90,22 +182,28 @@ def check_keywords(title: str, keywords: list[str]) -> bool:
     return any(keyword in title for keyword in keywords)
 
 
-def hook_handler(data):
+def backtest_keywords(titles: list[str], keywords: list[str], samples: int = 5) -> dict:
     """
-    Parse the data from the Youtube webhook and add it to the queue
+    Evaluate keywords against many titles with the same rule as check_keywords.
+    The keywords are compiled into one pattern, so each title is scanned once.
     """
-    try:
-        video = youtube_parser(data)
-        if not video:
-            return
-        msg = {
-            'type': 'youtube',
-            'data': video,
-        }
-        BOT_QUEUE.put(msg)
-        logger.info(f"Added {msg} to queue")
-    except Exception as e:
-        unexpected_error_handler(logger, e, data=str(data))
+    pattern = re.compile("|".join(map(re.escape, keywords))) if keywords else None
+    matched, rejected = [], []
+    matched_count = 0
+    for title in titles:
+        if pattern is not None and pattern.search(title):
+            matched_count += 1
+            if len(matched) < samples:
+                matched.append(title)
+        elif len(rejected) < samples:
+            rejected.append(title)
+    return {
+        "total": len(titles),
+        "matched": matched_count,
+        "rejected": len(titles) - matched_count,
+        "matched_samples": matched,
+        "rejected_samples": rejected,
+    }
 
 
 def duration_to_str(duration: str) -> str:
@@ -118,50 +216,43 @@ def duration_to_str(duration: str) -> str:
     return f"[{duration}]"
 
 
-async def queue_handler(channel: discord.TextChannel, video: dict):
+async def queue_handler(channel: discord.TextChannel, video: dict) -> None:
     """
-    Add a video to the database and send it to the channel
+    Add a video to the database and send it to the channel.
+    Errors propagate to the dispatcher, which retries the notification.
+    The video is stored with sentAt unset until the message is sent, so a replay
+    after a failed send sends it instead of taking it for a duplicate.
     """
-    try:
-        if add_video(video):
-
-            duration: str = duration_to_str(video["duration"])
-            await channel.send(
-                content=f"New video {duration}: {videoId_to_url(video['_id'])}",
-                view=VideoView(
-                    video["_id"], no_db_log=video["channelId"] == DEBUG_CHANNEL)
-            )
-            logger.info(
-                f"Sent video \"{video['title']}\" to channel {channel}")
-    except Exception as e:
-        unexpected_error_handler(logger, e, video=video, channel=channel.name)
-
-async def resubscribe():
-    channels = get_channels(limit=0)
-    for channel in channels:
-        title = channel["title"]
-        logger.info(f"Resubbing {title}")
-
-        channel_id = channel["_id"]
-        await toggle_subscription(channel_id, "unsubscribe")
-        await asyncio.sleep(1)
-        await toggle_subscription(channel_id, "subscribe")
-        await asyncio.sleep(1)
-
+    stored = await get_video_by_id.aio(video["_id"])
+    if is_sent(stored):
+        logger.info(f"Video already sent: {video['_id']}")
+        return
+    if stored is None and not await add_video.aio({**video, "sentAt": None}):
+        raise Exception(f"Could not store video: {video['_id']}")
+
+    duration: str = duration_to_str(video["duration"])
+    await channel.send(
+        content=f"New video {duration}: {videoId_to_url(video['_id'])}",
+        view=VideoView(
+            video["_id"], no_db_log=video["channelId"] == DEBUG_CHANNEL)
+    )
+    await mark_video_sent.aio(video["_id"])
+    logger.info(
+        f"Sent video \"{video['title']}\" to channel {channel}")
 
 async def subscribe(channel: dict[str, str]) -> bool:
-    existing_channel = get_channel_by_id(channel["_id"])
+    existing_channel = await get_channel_by_id.aio(channel["_id"])
     if existing_channel:
         raise ValueError("Already subscribed")
-    add_channel(channel)
-    await toggle_subscription(channel["_id"], "subscribe")
+    await add_channel.aio(channel)
+    await subscription_manager.request(channel["_id"], "subscribe")
     return True
 
 
 async def unsubscribe(channel_id: str):
-    result = remove_channel(channel_id)
+    result = await remove_channel.aio(channel_id)
     if result.deleted_count == 1:
-        await toggle_subscription(channel_id, "unsubscribe")
+        await subscription_manager.request(channel_id, "unsubscribe")
     elif result.deleted_count == 0:
         logger.error(result)
         raise ValueError("Not subscribed")
@@ -169,22 +260,6 @@ async def unsubscribe(channel_id: str):
         raise Exception(f"Unexpected result: {result}")
 
 
-async def toggle_subscription(channel_id: str, mode: str) -> int:
-    topic = f"https://www.youtube.com/xml/feeds/videos.xml?channel_id={channel_id}"
-    verify = "async"
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-                "https://pubsubhubbub.appspot.com/subscribe",
-                data={
-                    "hub.callback": f"{CALLBACK_URL}/webhook/youtube",
-                    "hub.topic": topic,
-                    "hub.verify": verify,
-                    "hub.mode": mode,
-                }
-        ) as resp:
-            return resp.status
-
-
 def channelId_to_url(channel_id: str) -> str:
     return f"https://www.youtube.com/channel/{channel_id}"
 
@@ -201,37 +276,26 @@ def videoUrl_to_id(video_url: str) -> str:
     return video_url.split("=")[-1]
 
 
-def request_video_by_id(video_id: str, part: list=["contentDetails", "snippet"]) -> dict[str, str]:
+async def request_video_by_id(video_id: str) -> dict[str, str]:
+    """Fetch contentDetails and snippet of a video, batched with concurrent lookups"""
     video = None
     try:
-        with build("youtube", "v3", credentials=get_googleapi_credentials()) as youtube:
-            request = youtube.videos().list(
-                part=part,
-                id=video_id
-            )
-            response = request.execute()
-
-        if not response["items"]:
-            logger.critical(f"Received invalid response: {response}")
-        else:
-            video = response["items"][0]
-    except KeyError:
-        logger.info(f"video_id: {video_id}, response: {response}")
+        video = await video_lookup.get(video_id)
+        if not video:
+            logger.critical(f"Video not found: {video_id}")
     except Exception as e:
-        unexpected_error_handler(logger, e)
+        unexpected_error_handler(logger, e, video_id=video_id)
     finally:
         return video
 
 
-def request_channelTitle_by_id(channel_id: str) -> str:
+async def request_channelTitle_by_id(channel_id: str) -> str:
     title = None
     try:
-        with build("youtube", "v3", credentials=get_googleapi_credentials()) as youtube:
-            request = youtube.channels().list(
-                part="snippet",
-                id=channel_id
-            )
-            response = request.execute()
+        response = await youtube_api.channels(
+            part="snippet",
+            id=channel_id
+        )
         title = response["items"][0]["snippet"]["title"]
     except KeyError:
         logger.info(response)
@@ -241,18 +305,16 @@ def request_channelTitle_by_id(channel_id: str) -> str:
         return title
 
 
-def request_videos_by_channelId(channel_id: str) -> list[dict[str, str]]:
+async def request_videos_by_channelId(channel_id: str) -> list[dict[str, str]]:
     videos = []
     try:
-        with build("youtube", "v3", credentials=get_googleapi_credentials()) as youtube:
-            request = youtube.search().list(
-                part="snippet",
-                channelId=channel_id,
-                maxResults=25,
-                order="date",
-                type="video"
-            )
-            response = request.execute()
+        response = await youtube_api.search(
+            part="snippet",
+            channelId=channel_id,
+            maxResults=25,
+            order="date",
+            type="video"
+        )
         videos = response["items"]
     except KeyError as e:
         unexpected_error_handler(logger, e, response=response)
@@ -262,71 +324,148 @@ def request_videos_by_channelId(channel_id: str) -> list[dict[str, str]]:
         return videos
 
 
-async def find_missing_videos():
-    channels = get_channels(limit=0)
-
-    # Get RFC 3339 timestamp of 24 hours ago
-    yesterday = datetime.now(timezone.utc) - timedelta(days=2)
-    yesterday = yesterday.isoformat(timespec='seconds')
-
-    with build("youtube", "v3", credentials=get_googleapi_credentials()) as youtube:
-        for channel in channels:
-            channel_id = channel["_id"]
-            channel_title = channel["title"]
-            logger.info(f"Checking {channel_title}...")
-
-            # Get videos published in the last 24 hours
-            request = youtube.search().list(
-                part="snippet",
-                channelId=channel_id,
-                order="date",
-                publishedAfter=yesterday,
-                type="video"
-            )
-            response = request.execute()
-
-            # Check if any of the videos are missing from the database
-            for item in response["items"]:
-                video_id = item["id"]["videoId"]
-                title = item["snippet"]["title"]
-                if get_video_by_id(video_id):
-                    continue
-                has_keywords = "keywords" in channel and channel["keywords"]
-                if has_keywords:
-                    if not check_keywords(title, channel["keywords"]):
-                        logger.info(f"Missing video does not match keywords: {title} - {channel_title}")
-                        continue
-
-
-                logger.info(f"Missing video: {title} - {channel_title}")
-
-                # Request video duration
-                vid_request = youtube.videos().list(
-                    part="contentDetails",
-                    id=video_id
-                )
-                vid_response = vid_request.execute()
-                if not vid_response["items"]:
-                    logger.critical(f"Received invalid response: {vid_response}")
-                    continue
-                duration = vid_response["items"][0]["contentDetails"]["duration"]
-            
-                if has_keywords and "$SHORT" in channel["keywords"]:
-                    if not check_short(video["duration"]):
-                        logger.info(f"Missing video is too long: {title} - {channel_title}")
-                        return None
-
-
-                video = {
+async def request_titles_by_channelId(channel_id: str) -> tuple[list[str], str]:
+    """
+    Return the titles of the channel's videos and where they came from.
+    Stored videos are used when there are any, the API only as a fallback.
+    """
+    titles = await get_video_titles_by_channelId.aio(channel_id)
+    if titles:
+        return titles, "stored"
+    videos = await request_videos_by_channelId(channel_id)
+    return [video["snippet"]["title"] for video in videos], "recent"
+
+
+def uploads_playlist_id(channel_id: str) -> str:
+    """A channel's uploads playlist id is its channel id with the UC prefix replaced by UU"""
+    return "UU" + channel_id[2:]
+
+
+async def request_uploads_since(channel_id: str, watermark: str) -> list[dict]:
+    """
+    Return the uploads published after the watermark, newest first.
+    Each page of the uploads playlist costs 1 unit; paging stops at the watermark.
+    """
+    items = []
+    page_token = None
+    for _ in range(MISSING_VIDEOS_MAX_PAGES):
+        response = await youtube_api.playlist_items(
+            part="snippet,contentDetails",
+            playlistId=uploads_playlist_id(channel_id),
+            maxResults=50,
+            pageToken=page_token,
+        )
+        reached_watermark = False
+        for item in response.get("items", []):
+            published_at = item["contentDetails"].get("videoPublishedAt")
+            if not published_at:
+                # Private or deleted video
+                continue
+            if published_at < watermark:
+                reached_watermark = True
+                continue
+            items.append(item)
+        page_token = response.get("nextPageToken")
+        if reached_watermark or not page_token:
+            break
+    return items
+
+
+async def reconcile_channel(channel: dict) -> int:
+    """Queue the channel's uploads since its watermark that were never sent. Return how many were queued."""
+    channel_id = channel["_id"]
+    channel_title = channel["title"]
+    keywords = channel.get("keywords") or []
+    # Same format as videoPublishedAt, so the two compare as strings
+    watermark = channel.get("reconciledAt") or (
+        datetime.now(timezone.utc) - timedelta(days=MISSING_VIDEOS_LOOKBACK_DAYS)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    logger.info(f"Checking {channel_title} since {watermark}...")
+
+    items = await request_uploads_since(channel_id, watermark)
+    if not items:
+        return 0
+
+    existing = await get_existing_video_ids.aio([item["contentDetails"]["videoId"] for item in items])
+    candidates = []
+    claimed = set()
+    unresolved = []
+    try:
+        for item in items:
+            video_id = item["contentDetails"]["videoId"]
+            title = item["snippet"]["title"]
+            if video_id in existing:
+                continue
+            if keywords and "$SHORT" not in keywords and not check_keywords(title, keywords):
+                logger.info(f"Missing video does not match keywords: {title} - {channel_title}")
+                continue
+            if not seen_videos.claim(video_id):
+                # Still in the webhook pipeline, which may yet fail: check it again next run
+                unresolved.append(item["contentDetails"]["videoPublishedAt"])
+                continue
+            claimed.add(video_id)
+            candidates.append(item)
+
+        # Concurrent lookups are coalesced into batched videos.list calls
+        responses = await asyncio.gather(*(
+            video_lookup.get(item["contentDetails"]["videoId"]) for item in candidates))
+
+        queued = 0
+        for item, response in zip(candidates, responses):
+            video_id = item["contentDetails"]["videoId"]
+            title = item["snippet"]["title"]
+            if not response:
+                logger.info(f"Missing video is not available: {video_id} - {channel_title}")
+                unresolved.append(item["contentDetails"]["videoPublishedAt"])
+                continue
+            duration = response["contentDetails"]["duration"]
+            if "$SHORT" in keywords and not check_short(duration):
+                logger.info(f"Missing video is too long: {title} - {channel_title}")
+                seen_videos.done(video_id)
+                claimed.discard(video_id)
+                continue
+
+            logger.info(f"Missing video: {title} - {channel_title}")
+            BOT_QUEUE.put({
+                'type': 'youtube',
+                'data': {
                     "_id": video_id,
                     "channelId": channel_id,
-                    "title": item["snippet"]["title"],
+                    "title": title,
                     "duration": duration,
-                }
-
-                # Add video to the queue
-                msg = {
-                    'type': 'youtube',
-                    'data': video,
-                }
-                BOT_QUEUE.put(msg)
+                },
+            })
+            seen_videos.done(video_id)
+            claimed.discard(video_id)
+            queued += 1
+
+        # The uploads playlist lists videos late, so the next run re-reads an overlap
+        # window; videos not resolved yet hold the watermark back further
+        newest = datetime.fromisoformat(max(item["contentDetails"]["videoPublishedAt"] for item in items))
+        reconciled_at = (newest - timedelta(hours=MISSING_VIDEOS_OVERLAP_HOURS)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        await update_channel_by_id.aio(channel_id, {"reconciledAt": min([reconciled_at] + unresolved)})
+        return queued
+    finally:
+        for video_id in claimed:
+            seen_videos.forget(video_id)
+
+
+async def find_missing_videos() -> int:
+    """
+    Queue videos the webhook missed, checking up to MISSING_VIDEOS_CONCURRENCY
+    channels at a time. Return how many videos were queued.
+    """
+    channels = await get_channels.aio(limit=0)
+    semaphore = asyncio.Semaphore(MISSING_VIDEOS_CONCURRENCY)
+
+    async def reconcile(channel: dict) -> int:
+        async with semaphore:
+            try:
+                return await reconcile_channel(channel)
+            except (QuotaExceededError, YouTubeApiError):
+                raise
+            except Exception as e:
+                unexpected_error_handler(logger, e, channel_id=channel["_id"])
+                return 0
+
+    with quota.feature("missing"):
+        return sum(await asyncio.gather(*(reconcile(channel) for channel in channels)))
@@ -24,6 +24,9 @@ class FrenchView(view.View):
         try:
             await interaction.response.defer(thinking=True)
             video = await french_utils.random_video()
+            if video is None:
+                await interaction.followup.send("No video left to suggest", ephemeral=True)
+                return
             await interaction.followup.send(
                 content=f"More French {youtube_utils.duration_to_str(video['duration'])}: {youtube_utils.videoId_to_url(video['_id'])}",
                 view=FrenchView(video_id=video["_id"]),
@@ -1,7 +1,7 @@
 import discord
 from discord.ui import View, Button
 from queries.french_queries import add_playlist
-from utils.french_utils import request_playlistTitle_by_id
+from utils.french_utils import request_playlistTitle_by_id, schedule_sync
 from utils.logging_utils import setup_logger, unexpected_error_handler
 
 
@@ -15,7 +15,7 @@ class PlaylistConfirmView(View):
     async def add_handler(self, interaction: discord.Interaction, button: discord.ui.Button):
         try:
             await interaction.response.defer()
-            title = request_playlistTitle_by_id(self.playlist_id)
+            title = await request_playlistTitle_by_id(self.playlist_id)
             if not title:
                 res = await interaction.followup.send("Playlist not found", ephemeral=True, wait=True)
             else:
@@ -24,7 +24,8 @@ class PlaylistConfirmView(View):
                     "title": title,
                 }
                 self.logger.info(f"Adding {playlist}")
-                add_playlist(playlist=playlist)
+                await add_playlist.aio(playlist=playlist)
+                schedule_sync(playlist)
                 res = await interaction.followup.send(f"Added {playlist['title']}", ephemeral=True, wait=True)
         except ValueError:
             res = await interaction.followup.send("Already added", ephemeral=True, wait=True)
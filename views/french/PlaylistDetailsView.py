@@ -3,15 +3,15 @@ import discord
 from discord.ui import View, button
 from discord.ui.item import Item
 from config import FEEDBACK_TIMEOUT
-from queries.french_queries import get_playlist_by_id, remove_playlist
+from queries.french_queries import remove_playlist
 
 from utils.logging_utils import setup_logger, unexpected_error_handler
 logger = setup_logger(__name__)
 
 class PlaylistDetailsView(View):
-    def __init__(self, playlist_id: str, **kwargs):
+    def __init__(self, playlist: dict[str, str], **kwargs):
         super().__init__(**kwargs)
-        self.playlist = get_playlist_by_id(playlist_id)
+        self.playlist = playlist
     
     @button(style=discord.ButtonStyle.success, label="Finish")
     async def done(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -33,7 +33,7 @@ class PlaylistDetailsView(View):
     async def remove(self, interaction: discord.Interaction, button: discord.ui.Button):
         try:
             await interaction.response.edit_message(content=f"Removing playlist: {self.playlist['title']}", view=None, delete_after=FEEDBACK_TIMEOUT)
-            result = remove_playlist(playlist_id=self.playlist["_id"])
+            result = await remove_playlist.aio(playlist_id=self.playlist["_id"])
             if result.deleted_count == 1:
                 res = await interaction.followup.send(content=f"Removed playlist: {self.playlist['title']}", ephemeral=True, wait=True)
                 logger.info(f"Removed playlist: {self.playlist}")
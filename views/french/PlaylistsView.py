@@ -24,7 +24,7 @@ class RemoveButton(Button):
             }
             logger.info(f"Removing playlist: {playlist}")
             await interaction.response.edit_message(content=f"Removing playlist: {playlist['title']}", view=None, delete_after=FEEDBACK_TIMEOUT)
-            result = remove_playlist(playlist_id=playlist["_id"])
+            result = await remove_playlist.aio(playlist_id=playlist["_id"])
             if result.deleted_count == 1:
                 res = await interaction.followup.send(content=f"Removed playlist: {playlist['title']}", ephemeral=True, wait=True)
                 logger.info(f"Removed playlist: {playlist}")
@@ -49,6 +49,9 @@ class RandomButton(Button):
             await interaction.response.defer(thinking=True, ephemeral=True)
             
             video = await french_utils.random_video(playlists=[_id])
+            if video is None:
+                await interaction.followup.send(content=f"No video left to suggest in {title}", ephemeral=True)
+                return
 
             await interaction.followup.send(
                 content=f"Random video from {title}: {youtube_utils.videoId_to_url(video['_id'])}",
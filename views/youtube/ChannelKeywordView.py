@@ -1,9 +1,10 @@
 from discord.ui import Button, Modal, View, TextInput
 import discord
 from config import FEEDBACK_TIMEOUT, RESULT_TIMEOUT
-from queries.youtube_queries import get_channel_by_id, update_channel_by_id
+from queries.youtube_queries import update_channel_by_id
 from utils.logging_utils import setup_logger, unexpected_error_handler
-from utils.youtube_utils import channelId_to_url, check_keywords, request_videos_by_channelId
+from utils.quota_utils import quota
+from utils.youtube_utils import backtest_keywords, channelId_to_url, request_titles_by_channelId
 
 
 logger = setup_logger(__name__)
@@ -48,7 +49,7 @@ class PromptKeywordsModal(Modal):
     async def on_submit(self, interaction: discord.Interaction):
         await interaction.response.edit_message(content="Adding...", view=None, delete_after=FEEDBACK_TIMEOUT)
         keywords = list(map(str.strip, self.keywords.value.split(",")))
-        self.view.add_keywords(keywords)
+        await self.view.add_keywords(keywords)
         logger.info(
             f"Added keywords {keywords} to channel {self.view.channel['title']}")
         res = await interaction.followup.send(content=f"{channelId_to_url(self.view.channel['_id'])}", view=self.view, ephemeral=True, wait=True)
@@ -56,12 +57,12 @@ class PromptKeywordsModal(Modal):
 
 
 class ChannelKeywordView(View):
-    def __init__(self, channel_id):
+    def __init__(self, channel: dict[str, str]):
         super().__init__(timeout=RESULT_TIMEOUT)
-        self.channel: dict[str, str] = get_channel_by_id(channel_id)
+        self.channel: dict[str, str] = channel
         if not self.channel:
-            logger.critical(f"Channel {channel_id} not found")
-            raise Exception(f"Channel {channel_id} not found")
+            logger.critical("Channel not found")
+            raise Exception("Channel not found")
 
         self.add_item(AddButton())
 
@@ -82,7 +83,7 @@ class ChannelKeywordView(View):
         await interaction.response.edit_message(content="Deleting...", view=None, delete_after=FEEDBACK_TIMEOUT)
         logger.info(
             f"Deleting {self.select.values} from {self.channel['title']}")
-        self.remove_keywords(self.select.values)
+        await self.remove_keywords(self.select.values)
 
         res = await interaction.followup.send(content=f"{channelId_to_url(self.channel['_id'])}", view=self, ephemeral=True, wait=True)
         await res.delete(delay=RESULT_TIMEOUT)
@@ -98,13 +99,15 @@ class ChannelKeywordView(View):
         logger.info(
             f"Testing {keywords} from {self.channel['title']}")
 
-        videos = request_videos_by_channelId(self.channel["_id"])
+        with quota.feature("keywords"):
+            titles, source = await request_titles_by_channelId(self.channel["_id"])
+        result = backtest_keywords(titles, keywords)
 
-        description = ""
-        for item in videos:
-            title = item["snippet"]["title"]
-            icon = "✅" if check_keywords(title, keywords) else "🔳"
-            description += f"{icon} {title}\n"
+        description = f"{result['matched']} of {result['total']} {source} videos match, {result['rejected']} rejected\n"
+        for title in result["matched_samples"]:
+            description += f"✅ {title}\n"
+        for title in result["rejected_samples"]:
+            description += f"🔳 {title}\n"
 
         embed = discord.Embed(
             title=f"Keywords: {', '.join(keywords)}",
@@ -128,17 +131,17 @@ class ChannelKeywordView(View):
         res = await interaction.followup.send(content="Server error", ephemeral=True, wait=True)
         await res.delete(delay=FEEDBACK_TIMEOUT)
 
-    def add_keywords(self, keywords: list[str]):
+    async def add_keywords(self, keywords: list[str]):
         if "keywords" not in self.channel:
             self.channel["keywords"] = keywords
         else:
             self.channel["keywords"] = list(
                 set(self.channel["keywords"] + keywords))
 
-        update_channel_by_id(self.channel["_id"], self.channel)
+        await update_channel_by_id.aio(self.channel["_id"], self.channel)
         self.update_view()
 
-    def remove_keywords(self, keywords: list[str]):
+    async def remove_keywords(self, keywords: list[str]):
         if "keywords" not in self.channel:
             logger.critical(
                 f"Channel {self.channel['_id']} has no keywords to delete")
@@ -146,7 +149,7 @@ class ChannelKeywordView(View):
         self.channel["keywords"] = list(
             set(self.channel["keywords"]) - set(keywords))
 
-        update_channel_by_id(self.channel["_id"], self.channel)
+        await update_channel_by_id.aio(self.channel["_id"], self.channel)
         self.update_view()
 
     def update_view(self):
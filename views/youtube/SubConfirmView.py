@@ -1,6 +1,7 @@
 import discord
 from discord.ui import View, Button
 from utils.logging_utils import setup_logger, unexpected_error_handler
+from utils.quota_utils import quota
 
 from utils.youtube_utils import request_channelTitle_by_id, subscribe
 
@@ -15,7 +16,8 @@ class SubConfirmView(View):
     async def subscribe_handler(self, interaction: discord.Interaction, button: discord.ui.Button):
         try:
             await interaction.response.defer()
-            title = request_channelTitle_by_id(self.channel_id)
+            with quota.feature("subscribe"):
+                title = await request_channelTitle_by_id(self.channel_id)
             if not title:
                 res = await interaction.followup.send("Channel not found", ephemeral=True, wait=True)
             else:
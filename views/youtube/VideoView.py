@@ -50,7 +50,7 @@ class VideoView(view.View):
         try:
             await interaction.response.edit_message(content="👌", view=None, delete_after=FEEDBACK_TIMEOUT)
             if not self.no_db_log:
-                update_watched_at(self.video_id)
+                await update_watched_at.aio(self.video_id)
         except Exception as e:
             await interaction.response.send_message(f"Server Error", ephemeral=True)
             unexpected_error_handler(self.logger, e)
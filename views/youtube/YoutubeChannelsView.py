@@ -5,7 +5,7 @@ from config import FEEDBACK_TIMEOUT, RESULT_TIMEOUT
 from utils.logging_utils import setup_logger, unexpected_error_handler
 from utils.youtube_utils import subscribe
 import json
-from queries.youtube_queries import get_channels, get_channels_count
+from queries.youtube_queries import get_channel_by_id, get_channels
 
 from utils.youtube_utils import channelId_to_url, unsubscribe
 from views.youtube.ChannelKeywordView import ChannelKeywordView
@@ -76,7 +76,7 @@ class DetailsButton(Button):
             await interaction.response.defer(thinking=True, ephemeral=True)
             res = await interaction.followup.send(
                 content=f"{channelId_to_url(_id)}",
-                view=ChannelKeywordView(channel_id=_id),
+                view=ChannelKeywordView(channel=await get_channel_by_id.aio(_id)),
                 ephemeral=True,
                 wait=True,
             )
@@ -109,7 +109,7 @@ class NextButton(Button):
 
             end_title = select.options[-1].label
 
-            channels = get_channels(start_title=end_title, limit=view.per_page)
+            channels = await get_channels.aio(start_title=end_title, limit=view.per_page)
 
             # self.select.options.clear()
             # for channel in channels:
@@ -156,7 +156,7 @@ class PrevButton(Button):
 
             start_title = select.options[0].label
 
-            channels = get_channels(
+            channels = await get_channels.aio(
                 start_title=start_title, limit=view.per_page, reverse=True)
 
             view.init_options(reversed(channels))
@@ -189,7 +189,7 @@ class PageButton(Button):
 
 
 class YoutubeChannelsView(View):
-    def __init__(self, channels: list[dict[str, str]], subscribed: bool = True):
+    def __init__(self, channels: list[dict[str, str]], subscribed: bool = True, channels_count: int = 0):
         super().__init__()
 
         self.select = Select(
@@ -207,7 +207,7 @@ class YoutubeChannelsView(View):
             self.add_item(SubscribeButton(select=self.select))
         else:
             self.per_page = len(channels)
-            self.page_count = math.ceil(get_channels_count() / self.per_page)
+            self.page_count = math.ceil(channels_count / self.per_page)
             self.page = 1
 
             self.prev_button = PrevButton(select=self.select)
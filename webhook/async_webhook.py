@@ -0,0 +1,67 @@
+from aiohttp import web
+from utils.youtube_utils import notification_pipeline, validate_notification
+from utils.logging_utils import setup_logger, unexpected_error_handler
+from utils.subscription_utils import arecord_verification
+from webhook.signature import signatures_enabled, verify_signature
+
+logger = setup_logger(__name__)
+routes = web.RouteTableDef()
+
+
+@routes.get('/')
+async def index(request: web.Request):
+    return web.Response(text="OK")
+
+
+@routes.get('/webhook/youtube')
+async def youtube_challenge(request: web.Request):
+    try:
+        challenge = request.query.get('hub.challenge')
+        if challenge:
+            logger.info(f"Received challenge: {challenge}")
+            await arecord_verification(request.query)
+            return web.Response(text=challenge)
+        if request.query.get('hub.mode') == 'denied':
+            # Denials carry no challenge, only the reason
+            logger.warning(f"Hub denied {request.query.get('hub.topic')}: {request.query.get('hub.reason')}")
+            await arecord_verification(request.query)
+            return web.Response(text="OK")
+    except Exception as e:
+        unexpected_error_handler(
+            logger, e, request_args=dict(request.query))
+    return web.Response(text="Error")
+
+
+@routes.post('/webhook/youtube')
+async def youtube(request: web.Request):
+    try:
+        data = await request.read()
+        if signatures_enabled() and not verify_signature(
+                data, request.headers.get('X-Hub-Signature'), request.query.get('channel_id')):
+            # The hub expects a 2xx even for pushes that fail verification
+            logger.warning("Dropped notification with invalid signature")
+            return web.Response(status=202, text="Accepted")
+        if not validate_notification(data):
+            logger.warning(f"Rejected invalid notification of {len(data)} bytes")
+            return web.Response(status=400, text="Error")
+        notification_pipeline.submit(data)
+        return web.Response(status=202, text="Accepted")
+    except Exception as e:
+        unexpected_error_handler(logger, e)
+    return web.Response(status=500, text="Error")
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app.add_routes(routes)
+    return app
+
+
+async def start_server(host: str, port: int) -> web.AppRunner:
+    """Serve the webhook on the running event loop, next to the bot"""
+    runner = web.AppRunner(create_app(), access_log=setup_logger("aiohttp.access"))
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port)
+    await site.start()
+    logger.info(f"Async webhook listening on {host}:{port}")
+    return runner
@@ -1,32 +1,99 @@
-from bs4 import BeautifulSoup
+import io
+from typing import Iterator, NamedTuple, Optional, Union
+from lxml import etree
 
+ATOM_NS = "http://www.w3.org/2005/Atom"
+YT_NS = "http://www.youtube.com/xml/schemas/2015"
+TOMBSTONE_NS = "http://purl.org/atompub/tombstones/1.0"
 
-def youtube_parser(content: str) -> str:
-    """Parse the content of a YouTube feed and return the link to the video"""
-    # id, title, channelId, watchTime, duration
-    video_url = None
-    video = dict()
+FEED = f"{{{ATOM_NS}}}feed"
+ENTRY = f"{{{ATOM_NS}}}entry"
+DELETED_ENTRY = f"{{{TOMBSTONE_NS}}}deleted-entry"
+TITLE = f"{{{ATOM_NS}}}title"
+PUBLISHED = f"{{{ATOM_NS}}}published"
+UPDATED = f"{{{ATOM_NS}}}updated"
+VIDEO_ID = f"{{{YT_NS}}}videoId"
+CHANNEL_ID = f"{{{YT_NS}}}channelId"
+DELETED_BY_URI = f"{{{TOMBSTONE_NS}}}by/{{{ATOM_NS}}}uri"
+
+
+class FeedParseError(ValueError):
+    pass
+
+
+class FeedEntry(NamedTuple):
+    video_id: str
+    channel_id: str
+    title: str
+    published: Optional[str]
+    updated: Optional[str]
+
+
+class DeletedEntry(NamedTuple):
+    video_id: str
+    channel_id: Optional[str]
+    deleted_at: Optional[str]
+
+
+def parse_feed(content: bytes) -> Iterator[Union[FeedEntry, DeletedEntry]]:
+    """
+    Stream every <entry> and <at:deleted-entry> of a YouTube Atom push.
+    Raise FeedParseError as soon as the payload is not well-formed XML, is not an
+    Atom feed, or has an entry without a video or channel id.
+    Entries are cleared once read, so memory does not grow with the feed.
+    """
+    context = etree.iterparse(
+        io.BytesIO(content),
+        events=("start", "end"),
+        tag=(FEED, ENTRY, DELETED_ENTRY),
+        resolve_entities=False,
+        no_network=True,
+        huge_tree=False,
+    )
+    seen_feed = False
     try:
-        soup = BeautifulSoup(content, 'xml')
-        if not soup.entry:
-            # TODO: log response
-            return None
-        entry = soup.entry
-        video = {
-            "_id": entry.videoId.text,
-            "channelId": entry.channelId.text,
-            "title": entry.title.text,
-        }
-        print(entry.prettify())
-        print(video)
-    # except Exception as e:
-    #     unexpected_error_handler(logger, e, content=content)
-    finally:
-        return video_url
+        for event, element in context:
+            if event == "start":
+                if element.tag == FEED:
+                    seen_feed = True
+                elif not seen_feed:
+                    raise FeedParseError(f"Unexpected root element {element.tag}")
+                continue
+
+            if element.tag == ENTRY:
+                video_id = element.findtext(VIDEO_ID)
+                channel_id = element.findtext(CHANNEL_ID)
+                if not video_id or not channel_id:
+                    raise FeedParseError("Entry without videoId or channelId")
+                yield FeedEntry(
+                    video_id=video_id,
+                    channel_id=channel_id,
+                    title=element.findtext(TITLE) or "",
+                    published=element.findtext(PUBLISHED),
+                    updated=element.findtext(UPDATED),
+                )
+            elif element.tag == DELETED_ENTRY:
+                channel_uri = element.findtext(DELETED_BY_URI)
+                yield DeletedEntry(
+                    video_id=element.get("ref", "").removeprefix("yt:video:"),
+                    channel_id=channel_uri.rsplit("/", 1)[-1] if channel_uri else None,
+                    deleted_at=element.get("when"),
+                )
+            else:
+                continue
+
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+    except etree.XMLSyntaxError as e:
+        raise FeedParseError(str(e)) from e
+
+    if not seen_feed:
+        raise FeedParseError("Payload is not an Atom feed")
 
 
 if __name__ == "__main__":
-    content = """<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015"
+    content = b"""<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015"
          xmlns="http://www.w3.org/2005/Atom">
   <link rel="hub" href="https://pubsubhubbub.appspot.com"/>
   <link rel="self" href="https://www.youtube.com/xml/feeds/videos.xml?channel_id=CHANNEL_ID"/>
@@ -46,4 +113,5 @@ if __name__ == "__main__":
     <updated>2015-03-09T19:05:24.552394234+00:00</updated>
   </entry>
 </feed>"""
-    print(youtube_parser(content))
+    for record in parse_feed(content):
+        print(record)
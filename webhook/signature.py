@@ -0,0 +1,63 @@
+import hashlib
+import hmac
+import threading
+
+from config import WEBHOOK_SECRET, WEBHOOK_SECRET_PER_CHANNEL
+
+ALGORITHMS = {
+    "sha1": hashlib.sha1,
+    "sha256": hashlib.sha256,
+    "sha384": hashlib.sha384,
+    "sha512": hashlib.sha512,
+}
+
+signature_stats = {"accepted": 0, "missing": 0, "malformed": 0, "mismatch": 0}
+_stats_lock = threading.Lock()
+
+
+def signatures_enabled() -> bool:
+    return bool(WEBHOOK_SECRET)
+
+
+def hub_secret(channel_id: str = None) -> str:
+    """
+    Return the hub.secret registered for a channel.
+    Per-channel secrets are derived from WEBHOOK_SECRET, so nothing has to be stored.
+    """
+    if not WEBHOOK_SECRET_PER_CHANNEL:
+        return WEBHOOK_SECRET
+    if not channel_id:
+        raise ValueError("A channel id is required for per-channel secrets")
+    return hmac.new(WEBHOOK_SECRET.encode(), channel_id.encode(), hashlib.sha256).hexdigest()
+
+
+def _count(result: str):
+    with _stats_lock:
+        signature_stats[result] += 1
+
+
+def verify_signature(body: bytes, header: str, channel_id: str = None) -> bool:
+    """Check an X-Hub-Signature header ("<algorithm>=<hex digest>") against the raw body"""
+    if not header:
+        _count("missing")
+        return False
+
+    algorithm, _, signature = header.partition("=")
+    digestmod = ALGORITHMS.get(algorithm.strip().lower())
+    if not digestmod or not signature:
+        _count("malformed")
+        return False
+
+    try:
+        secret = hub_secret(channel_id)
+    except ValueError:
+        _count("malformed")
+        return False
+
+    expected = hmac.new(secret.encode(), body, digestmod).hexdigest()
+    if not hmac.compare_digest(expected, signature.strip().lower()):
+        _count("mismatch")
+        return False
+
+    _count("accepted")
+    return True
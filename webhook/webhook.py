@@ -1,6 +1,8 @@
 from flask import Flask, request
-from utils.youtube_utils import hook_handler
+from utils.youtube_utils import notification_pipeline, validate_notification
 from utils.logging_utils import setup_logger, unexpected_error_handler
+from utils.subscription_utils import record_verification
+from webhook.signature import signatures_enabled, verify_signature
 from werkzeug.middleware.proxy_fix import ProxyFix
 
 logger = setup_logger(__name__)
@@ -21,15 +23,31 @@ def youtube():
             challenge = request.args.get('hub.challenge')
             if challenge:
                 logger.info(f"Received challenge: {challenge}")
+                record_verification(request.args)
                 return challenge
+            if request.args.get('hub.mode') == 'denied':
+                # Denials carry no challenge, only the reason
+                logger.warning(f"Hub denied {request.args.get('hub.topic')}: {request.args.get('hub.reason')}")
+                record_verification(request.args)
+                return 'OK'
         except Exception as e:
             unexpected_error_handler(
                 logger, e, request_data=request.data, request_args=request.args)
     elif request.method == 'POST':
         try:
-            hook_handler(request.data)
+            if signatures_enabled() and not verify_signature(
+                    request.data, request.headers.get('X-Hub-Signature'), request.args.get('channel_id')):
+                # The hub expects a 2xx even for pushes that fail verification
+                logger.warning("Dropped notification with invalid signature")
+                return 'Accepted', 202
+            if not validate_notification(request.data):
+                logger.warning(f"Rejected invalid notification of {len(request.data)} bytes")
+                return 'Error', 400
+            notification_pipeline.submit(request.data)
+            return 'Accepted', 202
         except Exception as e:
             unexpected_error_handler(logger, e)
+            return 'Error', 500
     else:
         logger.critical(f"Received invalid request: {request}")
     return 'Error'